@@ -3,7 +3,8 @@ Admin configuration for quizzes app
 """
 
 from django.contrib import admin
-from .models import Category, Subcategory, Quiz, Question, UserQuizAttempt, UserAnswer
+from .models import Category, Subcategory, Quiz, Question, QuizQuestion, UserQuizAttempt, UserAnswer, AnswerExplanation, AICallLog
+from .services.snapshot_service import quiz_snapshot_service
 
 
 class SubcategoryInline(admin.TabularInline):
@@ -30,19 +31,21 @@ class SubcategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
-class QuestionInline(admin.TabularInline):
-    model = Question
+class QuizQuestionInline(admin.TabularInline):
+    model = QuizQuestion
     extra = 1
-    fields = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer', 'order']
+    fields = ['question', 'order']
+    raw_id_fields = ['question']
 
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
-    list_display = ['title', 'category', 'subcategory', 'difficulty', 'is_active', 'created_at']
+    list_display = ['title', 'category', 'subcategory', 'difficulty', 'question_count', 'is_active', 'created_at']
     list_filter = ['category', 'difficulty', 'is_active', 'created_at']
     search_fields = ['title', 'description']
     ordering = ['-created_at']
-    inlines = [QuestionInline]
+    readonly_fields = ['question_count']
+    inlines = [QuizQuestionInline]
     
     fieldsets = (
         ('Basic Information', {
@@ -52,21 +55,31 @@ class QuizAdmin(admin.ModelAdmin):
             'fields': ('time_limit', 'pass_percentage', 'is_active')
         }),
         ('Metadata', {
-            'fields': ('created_by',)
+            'fields': ('created_by', 'question_count')
         }),
     )
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline question edits are saved after the quiz itself
+        quiz_snapshot_service.invalidate(Quiz.objects.filter(pk=form.instance.pk))
 
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
-    list_display = ['question_text_short', 'quiz', 'correct_answer', 'order', 'created_at']
-    list_filter = ['quiz__category', 'quiz__difficulty', 'created_at']
-    search_fields = ['question_text', 'quiz__title']
-    ordering = ['quiz', 'order']
+    list_display = ['question_text_short', 'category', 'subcategory', 'difficulty', 'correct_answer', 'created_at']
+    list_filter = ['category', 'difficulty', 'created_at']
+    search_fields = ['question_text']
+    ordering = ['-created_at']
     
     def question_text_short(self, obj):
         return obj.question_text[:50] + '...' if len(obj.question_text) > 50 else obj.question_text
     question_text_short.short_description = 'Question'
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            quiz_snapshot_service.invalidate(Quiz.objects.filter(questions=obj))
 
 
 class UserAnswerInline(admin.TabularInline):
@@ -97,3 +110,27 @@ class UserAnswerAdmin(admin.ModelAdmin):
     def question_short(self, obj):
         return obj.question.question_text[:50] + '...'
     question_short.short_description = 'Question'
+
+
+
+@admin.register(AnswerExplanation)
+class AnswerExplanationAdmin(admin.ModelAdmin):
+    list_display = ['question_short', 'selected_answer', 'created_at']
+    list_filter = ['selected_answer', 'created_at']
+    search_fields = ['question__question_text', 'explanation']
+    raw_id_fields = ['question']
+    ordering = ['-created_at']
+    
+    def question_short(self, obj):
+        return obj.question.question_text[:50] + '...'
+    question_short.short_description = 'Question'
+
+
+@admin.register(AICallLog)
+class AICallLogAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'endpoint', 'category', 'model', 'items', 'prompt_tokens', 'completion_tokens',
+                    'cached_tokens', 'latency_ms', 'cost_usd', 'outcome', 'cache_hit']
+    list_filter = ['endpoint', 'outcome', 'cache_hit', 'model', 'created_at']
+    search_fields = ['category', 'model']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
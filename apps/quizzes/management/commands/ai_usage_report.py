@@ -0,0 +1,43 @@
+"""
+Management command to report AI usage from the AI call ledger
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.quizzes.services.ledger import ai_call_ledger
+
+GROUP_FIELDS = ('day', 'category', 'endpoint', 'model')
+
+
+class Command(BaseCommand):
+    help = 'Aggregate AI calls, tokens, latency, cache hits and cost per day/category/endpoint/model'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Number of days to report')
+        parser.add_argument(
+            '--by', default='day,endpoint',
+            help=f'Comma-separated grouping, any of: {", ".join(GROUP_FIELDS)}'
+        )
+    
+    def handle(self, *args, **options):
+        group_by = [field.strip() for field in options['by'].split(',') if field.strip()]
+        unknown = set(group_by) - set(GROUP_FIELDS)
+        if unknown:
+            raise CommandError(f'Unknown grouping: {", ".join(sorted(unknown))}')
+        
+        # Rows still buffered by this process are included
+        ai_call_ledger.flush()
+        
+        header = ' '.join(f'{field:<18}' for field in group_by)
+        self.stdout.write(
+            f'{header} {"calls":>7} {"hit rate":>8} {"errors":>6} {"items":>7} {"prompt tok":>11} '
+            f'{"cached tok":>10} {"output tok":>10} {"avg ms":>7} {"cost $":>9}'
+        )
+        
+        for row in ai_call_ledger.summary(options['days'], group_by):
+            groups = ' '.join(f'{str(row[field] or "-")[:18]:<18}' for field in group_by)
+            self.stdout.write(
+                f'{groups} {row["calls"]:>7} {row["cache_hits"] / row["calls"]:>8.0%} {row["errors"]:>6} '
+                f'{row["total_items"] or 0:>7} {row["total_prompt_tokens"] or 0:>11} '
+                f'{row["total_cached_tokens"] or 0:>10} {row["total_completion_tokens"] or 0:>10} '
+                f'{row["avg_latency_ms"] or 0:>7.0f} {row["total_cost"] or 0:>9.4f}'
+            )
@@ -0,0 +1,58 @@
+"""
+Management command to compare the JSON and compact question response formats
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from apps.quizzes.services.ai_service import AIQuestionGenerator
+from apps.quizzes.services.rate_limiter import PRIORITY_BACKGROUND
+
+
+class Command(BaseCommand):
+    help = 'Benchmark output tokens and wall time of the json and compact response formats'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='5,10,15,20', help='Comma-separated question counts')
+        parser.add_argument('--repeat', type=int, default=3, help='Calls per format and size')
+        parser.add_argument('--topic', default='Python Programming', help='Topic of the generated questions')
+        parser.add_argument('--difficulty', default='medium', help='Difficulty of the generated questions')
+        parser.add_argument('--max-tokens', type=int, default=4000, help='Completion token limit, high enough to avoid truncation')
+    
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(
+            f'{"format":<8} {"questions":>9} {"parsed":>7} {"output tokens":>14} {"wall time (s)":>14}'
+        )
+        
+        for num_questions in sizes:
+            results = {}
+            for response_format in ('json', 'compact'):
+                generator = AIQuestionGenerator()
+                generator.response_format = response_format
+                generator.max_tokens = options['max_tokens']
+                
+                parsed = tokens = elapsed = 0
+                for _ in range(options['repeat']):
+                    started_at = time.monotonic()
+                    # One call for the whole quiz, so the format is the only variable
+                    response = generator._complete_questions(
+                        options['topic'], None, options['difficulty'], num_questions,
+                        priority=PRIORITY_BACKGROUND
+                    )
+                    elapsed += time.monotonic() - started_at
+                    tokens += response.completion_tokens
+                    parsed += len(generator._parse_questions(response.text.strip()))
+                
+                repeat = options['repeat']
+                results[response_format] = (tokens / repeat, elapsed / repeat)
+                self.stdout.write(
+                    f'{response_format:<8} {num_questions:>9} {parsed / repeat:>7.1f} '
+                    f'{tokens / repeat:>14.0f} {elapsed / repeat:>14.2f}'
+                )
+            
+            json_tokens, json_time = results['json']
+            compact_tokens, compact_time = results['compact']
+            self.stdout.write(self.style.SUCCESS(
+                f'{num_questions} questions: compact saves {1 - compact_tokens / max(json_tokens, 1):.0%} '
+                f'output tokens and {1 - compact_time / max(json_time, 1e-6):.0%} wall time'
+            ))
@@ -0,0 +1,246 @@
+"""
+Management command to load a question bank from a JSON, JSONL or CSV file
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.quizzes.models import Category, Question, Quiz, Subcategory
+from apps.quizzes.services import minhash
+from apps.quizzes.services.duplicate_service import duplicate_detection_service
+
+OPTION_KEYS = ['A', 'B', 'C', 'D']
+
+# Largest question object the JSON reader buffers, in characters
+MAX_OBJECT_SIZE = 1 << 20
+
+
+class Command(BaseCommand):
+    help = 'Stream questions from a JSON, JSONL or CSV file into the question bank'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument(
+            '--format', choices=['json', 'jsonl', 'csv'],
+            help='File format, taken from the file extension by default'
+        )
+        parser.add_argument('--category', help='Category name or slug for rows without one')
+        parser.add_argument('--subcategory', help='Subcategory name or slug for rows without one')
+        parser.add_argument(
+            '--difficulty', default='medium', choices=[choice for choice, _ in Quiz.DIFFICULTY_CHOICES],
+            help='Difficulty for rows without one'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Questions inserted per transaction')
+        parser.add_argument(
+            '--no-dedupe', action='store_true',
+            help='Skip the near-duplicate check, for banks known to be clean'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Processes computing near-duplicate fingerprints'
+        )
+    
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in ('json', 'jsonl', 'csv'):
+            raise CommandError(f'Unknown file format "{file_format}", pass --format')
+        
+        self.categories = {}
+        self.subcategories = {}
+        for category in Category.objects.all():
+            self.categories[category.name.lower()] = category
+            self.categories[category.slug] = category
+        for subcategory in Subcategory.objects.all():
+            self.subcategories[(subcategory.category_id, subcategory.name.lower())] = subcategory
+            self.subcategories[(subcategory.category_id, subcategory.slug)] = subcategory
+        
+        stats = {'read': 0, 'invalid': 0, 'duplicates': 0, 'imported': 0}
+        started = time.monotonic()
+        batch = []
+        
+        # MinHash fingerprints are pure CPU work; the main process only parses and writes.
+        # Workers only import services.minhash, which needs no django.setup()
+        self.executor = ProcessPoolExecutor(options['workers']) if options['workers'] > 1 else None
+        
+        with self.executor or nullcontext(), open(options['path'], newline='', encoding='utf-8') as f:
+            rows = {'json': self._read_json, 'jsonl': self._read_jsonl, 'csv': csv.DictReader}[file_format](f)
+            for row in rows:
+                stats['read'] += 1
+                parsed = self._parse(row, options)
+                if parsed is None:
+                    stats['invalid'] += 1
+                    continue
+                
+                batch.append(parsed)
+                if len(batch) >= options['batch_size']:
+                    self._insert(batch, not options['no_dedupe'], stats)
+                    batch = []
+                    self._report(stats, started)
+            
+            if batch:
+                self._insert(batch, not options['no_dedupe'], stats)
+            self._report(stats, started)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['imported']} of {stats['read']} questions "
+            f"({stats['invalid']} invalid, {stats['duplicates']} near-duplicates skipped)."
+        ))
+    
+    def _read_jsonl(self, f):
+        """Yield one question object per non-empty line"""
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    yield None
+    
+    def _read_json(self, f):
+        """
+        Yield the objects of a top-level JSON array, decoding it chunk by
+        chunk so the whole file is never held in memory
+        
+        A malformed object ends the import with its offset in the file:
+        objects are not delimited, so nothing after it can be trusted.
+        """
+        decoder = json.JSONDecoder()
+        buffer = ''
+        offset = 0
+        in_array = False
+        
+        for chunk in iter(lambda: f.read(65536), ''):
+            buffer += chunk
+            pos = 0
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos == len(buffer):
+                    break
+                
+                if not in_array:
+                    if buffer[pos] != '[':
+                        raise CommandError('A JSON file must hold an array of questions')
+                    in_array = True
+                    pos += 1
+                    continue
+                if buffer[pos] == ']':
+                    return
+                
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    # An object cut off by the chunk boundary fails at the end
+                    # of the buffer (or in the string it cuts); read on
+                    truncated = e.pos >= len(buffer) - 16 or e.msg.startswith('Unterminated string')
+                    if not truncated or len(buffer) - pos > MAX_OBJECT_SIZE:
+                        raise CommandError(f'Malformed JSON at character {offset + e.pos}: {e.msg}')
+                    break
+                yield item
+            buffer = buffer[pos:]
+            offset += pos
+        
+        raise CommandError('Unexpected end of JSON file')
+    
+    def _parse(self, row, options):
+        """
+        Turn a file row into a question dict and its bank cell
+        
+        Rows use the AI response shape ('question', 'options',
+        'correct_answer', 'explanation', optional 'rationales') or flat
+        option_a to option_d columns, plus optional category, subcategory
+        and difficulty. They are checked with Question.validate_generated,
+        like generated questions.
+        
+        Returns:
+            tuple: (question dict, category, subcategory, difficulty), or
+                None for an invalid row
+        """
+        if not isinstance(row, dict):
+            return None
+        
+        options_data = row.get('options')
+        if not isinstance(options_data, dict):
+            options_data = {key: row.get(f'option_{key.lower()}') for key in OPTION_KEYS}
+        question = {
+            'question': str(row.get('question') or row.get('question_text') or '').strip(),
+            'options': {key: str(text).strip() for key, text in options_data.items() if text},
+            'correct_answer': str(row.get('correct_answer') or '').strip().upper(),
+            'explanation': str(row.get('explanation') or '').strip(),
+        }
+        if row.get('rationales'):
+            question['rationales'] = row['rationales']
+        
+        if not question['question'] or not Question.validate_generated(question):
+            return None
+        
+        category = self.categories.get(str(row.get('category') or options['category'] or '').strip().lower())
+        if category is None:
+            return None
+        
+        subcategory = None
+        subcategory_name = str(row.get('subcategory') or options['subcategory'] or '').strip().lower()
+        if subcategory_name:
+            subcategory = self.subcategories.get((category.pk, subcategory_name))
+            if subcategory is None:
+                return None
+        
+        difficulty = str(row.get('difficulty') or options['difficulty']).strip().lower()
+        if difficulty not in dict(Quiz.DIFFICULTY_CHOICES):
+            return None
+        
+        return question, category, subcategory, difficulty
+    
+    def _insert(self, batch, dedupe, stats):
+        """
+        Insert one batch of parsed rows in a single transaction
+        """
+        texts = [duplicate_detection_service.fingerprint_text(q_data) for q_data, _, _, _ in batch]
+        if self.executor:
+            threshold = settings.QUESTION_DUPLICATE_THRESHOLD
+            buckets = list(self.executor.map(
+                minhash.text_buckets, texts, [threshold] * len(texts), chunksize=64
+            ))
+        else:
+            buckets = [duplicate_detection_service.text_buckets(text) for text in texts]
+        
+        by_category = {}
+        for parsed, question_buckets in zip(batch, buckets):
+            by_category.setdefault(parsed[1], []).append((parsed, question_buckets))
+        
+        questions = []
+        kept_buckets = []
+        for category, rows in by_category.items():
+            if dedupe:
+                kept = {id(q_data) for q_data in duplicate_detection_service.drop_duplicates(
+                    category,
+                    [parsed[0] for parsed, _ in rows],
+                    buckets=[question_buckets for _, question_buckets in rows]
+                )}
+                stats['duplicates'] += len(rows) - len(kept)
+                rows = [(parsed, question_buckets) for parsed, question_buckets in rows if id(parsed[0]) in kept]
+            
+            for (q_data, _, subcategory, difficulty), question_buckets in rows:
+                questions.append(Question.from_generated(
+                    q_data, category=category, subcategory=subcategory, difficulty=difficulty
+                ))
+                kept_buckets.append(question_buckets)
+        
+        with transaction.atomic():
+            questions = Question.objects.bulk_create(questions)
+            duplicate_detection_service.index_questions(questions, buckets=kept_buckets)
+        stats['imported'] += len(questions)
+    
+    def _report(self, stats, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(
+            f"{stats['read']} rows read, {stats['imported']} imported | "
+            f"{stats['read'] / elapsed:.0f} rows/sec"
+        )
+
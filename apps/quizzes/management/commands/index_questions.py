@@ -0,0 +1,38 @@
+"""
+Management command to build near-duplicate fingerprints for stored questions
+"""
+
+from django.core.management.base import BaseCommand
+from apps.quizzes.models import Question, QuestionFingerprint
+from apps.quizzes.services.duplicate_service import FINGERPRINT_FIELDS, duplicate_detection_service
+
+
+class Command(BaseCommand):
+    help = 'Index stored questions that have no near-duplicate fingerprints yet'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop every fingerprint and index all questions again')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Questions indexed per batch')
+    
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            QuestionFingerprint.objects.all().delete()
+        
+        indexed = 0
+        last_id = 0
+        while True:
+            # Walk the table by primary key so each batch is an index range scan
+            batch = list(
+                Question.objects.filter(id__gt=last_id, fingerprints__isnull=True)
+                .order_by('id')
+                .only('category_id', *FINGERPRINT_FIELDS)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            
+            duplicate_detection_service.index_questions(batch)
+            indexed += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'Indexed {indexed} questions...')
+        
+        self.stdout.write(self.style.SUCCESS(f'Done, {indexed} questions indexed.'))
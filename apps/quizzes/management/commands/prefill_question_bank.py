@@ -0,0 +1,136 @@
+"""
+Management command to seed the question bank before launch traffic
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.quizzes.services.ai_service import ai_generator
+from apps.quizzes.services.pool_service import question_pool_service
+
+
+class Command(BaseCommand):
+    help = 'Generate questions for every category/subcategory/difficulty cell up to a target count'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--target', type=int, default=settings.QUIZ_POOL_TARGET, help='Questions per cell')
+        parser.add_argument('--category', help='Only prefill cells of this category slug')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent AI calls')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OPENAI_CHUNK_SIZE,
+            help='Questions per difficulty level and AI call'
+        )
+        parser.add_argument('--checkpoint', default='prefill_question_bank.json', help='Checkpoint file for resuming')
+        parser.add_argument('--reset', action='store_true', help='Ignore an existing checkpoint and start over')
+    
+    def handle(self, *args, **options):
+        checkpoint_path = options['checkpoint']
+        done = set()
+        if os.path.exists(checkpoint_path) and not options['reset']:
+            with open(checkpoint_path) as f:
+                done = set(json.load(f)['done'])
+            self.stdout.write(f'Resuming, {len(done)} cells already complete.')
+        
+        # Plan one task per batch; questions already stored count towards the target
+        counts = question_pool_service.cell_counts()
+        plan = {}
+        for category, subcategory, difficulty in question_pool_service.iter_cells(options['category']):
+            cell = f'{category.pk}:{subcategory.pk if subcategory else 0}:{difficulty}'
+            missing = options['target'] - counts.get((category.pk, subcategory.pk if subcategory else None, difficulty), 0)
+            if cell not in done and missing > 0:
+                plan[cell] = (category, subcategory, difficulty, missing)
+            else:
+                done.add(cell)
+        
+        # The difficulty levels of a subcategory share their batches (one AI call each)
+        groups = {}
+        for cell, (category, subcategory, _, _) in plan.items():
+            groups.setdefault((category.pk, subcategory.pk if subcategory else None), []).append(cell)
+        
+        batches = []
+        for cells in groups.values():
+            for start in range(0, max(plan[cell][3] for cell in cells), options['batch_size']):
+                batches.append({
+                    cell: min(options['batch_size'], plan[cell][3] - start)
+                    for cell in cells if plan[cell][3] > start
+                })
+        remaining = {cell: sum(1 for batch in batches if cell in batch) for cell in plan}
+        self.stdout.write(f'{len(plan)} cells to fill with {len(batches)} batches.')
+        
+        lock = threading.Lock()
+        added = 0
+        failed = 0
+        short = set()
+        started_at = time.monotonic()
+        tokens_at_start = ai_generator.tokens_used
+        
+        def run(batch):
+            category, subcategory, _, _ = plan[next(iter(batch))]
+            counts = {plan[cell][2]: size for cell, size in batch.items()}
+            try:
+                return sum(question_pool_service.generate_variant_batch(category, subcategory, counts).values())
+            finally:
+                connection.close()
+        
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            futures = {executor.submit(run, batch): batch for batch in batches}
+            
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    count = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Batch for cells {", ".join(batch)} failed: {str(e)}')
+                    continue
+                
+                with lock:
+                    added += count
+                    for cell in batch:
+                        remaining[cell] -= 1
+                        if remaining[cell] > 0:
+                            continue
+                        
+                        # Dropped near-duplicates can leave a cell short; a rerun tops it up
+                        category, subcategory, difficulty, _ = plan[cell]
+                        if question_pool_service.pooled_count(category, subcategory, difficulty) >= options['target']:
+                            done.add(cell)
+                        else:
+                            short.add(cell)
+                    self._save_checkpoint(checkpoint_path, done)
+                
+                self._report(added, ai_generator.tokens_used - tokens_at_start, started_at)
+        
+        self._report(added, ai_generator.tokens_used - tokens_at_start, started_at)
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'{failed} batches failed; run the command again to resume from {checkpoint_path}.'
+            ))
+        elif short:
+            self.stdout.write(self.style.WARNING(
+                f'{len(short)} cells are below the target after dropping near-duplicates; '
+                f'run the command again to top them up.'
+            ))
+        else:
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+            self.stdout.write(self.style.SUCCESS(f'Question bank prefilled with {added} questions.'))
+    
+    def _save_checkpoint(self, path, done):
+        """Write completed cells atomically so an interrupted run can resume"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'done': sorted(done)}, f)
+        os.replace(tmp_path, path)
+    
+    def _report(self, added, tokens, started_at):
+        minutes = max(time.monotonic() - started_at, 1e-6) / 60
+        self.stdout.write(
+            f'{added} questions, {tokens} tokens | '
+            f'{added / minutes:.1f} questions/min, {tokens / minutes:.0f} tokens/min'
+        )
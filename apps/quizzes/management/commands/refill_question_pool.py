@@ -0,0 +1,41 @@
+"""
+Management command to refill the pre-generated question pool
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from apps.quizzes.services.pool_service import question_pool_service
+
+
+class Command(BaseCommand):
+    help = 'Refill question pool cells that are below the low-water mark'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--category', help='Only refill cells of this category slug')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between passes in loop mode')
+    
+    def handle(self, *args, **options):
+        while True:
+            low_cells = question_pool_service.low_cells(options['category'])
+            
+            # Low difficulty levels of one subcategory are refilled together
+            groups = {}
+            for category, subcategory, difficulty in low_cells:
+                groups.setdefault((category, subcategory), []).append(difficulty)
+            
+            for (category, subcategory), difficulties in groups.items():
+                added = question_pool_service.refill_cells_if_low(category, subcategory, difficulties)
+                for difficulty in difficulties:
+                    self.stdout.write(
+                        f'{category.name} -> {subcategory.name if subcategory else "(all)"} '
+                        f'[{difficulty}]: +{added.get(difficulty, 0)} questions'
+                    )
+            
+            self.stdout.write(
+                self.style.SUCCESS(f'Pool pass complete, {len(low_cells)} cells were below low-water mark.')
+            )
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
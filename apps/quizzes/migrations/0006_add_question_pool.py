@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_question_cells(apps, schema_editor):
+    """Copy category/subcategory/difficulty from each question's quiz"""
+    Question = apps.get_model('quizzes', 'Question')
+    Quiz = apps.get_model('quizzes', 'Quiz')
+    quiz = Quiz.objects.filter(pk=models.OuterRef('quiz_id'))
+    Question.objects.filter(quiz__isnull=False).update(
+        category_id=models.Subquery(quiz.values('category_id')[:1]),
+        subcategory_id=models.Subquery(quiz.values('subcategory_id')[:1]),
+        difficulty=models.Subquery(quiz.values('difficulty')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0005_add_database_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='quizzes.category'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='difficulty',
+            field=models.CharField(choices=[('easy', 'Easy'), ('medium', 'Medium'), ('hard', 'Hard')], default='medium', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='subcategory',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='questions', to='quizzes.subcategory'),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='quiz',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='quizzes.quiz'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['category', 'subcategory', 'difficulty', 'quiz'], name='quizzes_que_categor_99f0ab_idx'),
+        ),
+        migrations.RunPython(backfill_question_cells, migrations.RunPython.noop),
+    ]
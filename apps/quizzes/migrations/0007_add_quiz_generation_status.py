@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0006_add_question_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='generation_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('generating', 'Generating'), ('failed', 'Failed')], default='ready', help_text='Whether questions are still being streamed in by the AI', max_length=10),
+        ),
+    ]
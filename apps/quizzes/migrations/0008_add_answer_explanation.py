@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_answer_explanations(apps, schema_editor):
+    """Seed the shared store from explanations cached on answers"""
+    UserAnswer = apps.get_model('quizzes', 'UserAnswer')
+    AnswerExplanation = apps.get_model('quizzes', 'AnswerExplanation')
+    
+    seen = set()
+    explanations = []
+    answers = (
+        UserAnswer.objects.exclude(ai_explanation__isnull=True)
+        .exclude(ai_explanation='')
+        .values_list('question_id', 'selected_answer', 'ai_explanation')
+        .iterator()
+    )
+    for question_id, selected_answer, text in answers:
+        if (question_id, selected_answer) not in seen:
+            seen.add((question_id, selected_answer))
+            explanations.append(AnswerExplanation(
+                question_id=question_id,
+                selected_answer=selected_answer,
+                explanation=text,
+            ))
+    AnswerExplanation.objects.bulk_create(explanations, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0007_add_quiz_generation_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerExplanation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_answer', models.CharField(choices=[('A', 'Option A'), ('B', 'Option B'), ('C', 'Option C'), ('D', 'Option D')], max_length=1)),
+                ('explanation', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_explanations', to='quizzes.question')),
+            ],
+            options={
+                'verbose_name': 'Answer Explanation',
+                'verbose_name_plural': 'Answer Explanations',
+                'unique_together': {('question', 'selected_answer')},
+            },
+        ),
+        migrations.RunPython(copy_answer_explanations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0008_add_answer_explanation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='distractor_rationales',
+            field=models.JSONField(blank=True, default=dict, help_text='Why each wrong option is wrong, keyed by option letter'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0009_add_question_distractor_rationales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='question_fingerprints', to='quizzes.category')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='quizzes.question')),
+            ],
+            options={
+                'verbose_name': 'Question Fingerprint',
+                'verbose_name_plural': 'Question Fingerprints',
+                'indexes': [models.Index(fields=['category', 'bucket'], name='quizzes_que_categor_d314e0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0010_add_question_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AICallLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('endpoint', models.CharField(max_length=40)),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('model', models.CharField(blank=True, max_length=50)),
+                ('items', models.PositiveIntegerField(default=0, help_text='Questions or explanations asked for')),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('cached_tokens', models.PositiveIntegerField(default=0)),
+                ('latency_ms', models.PositiveIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('outcome', models.CharField(choices=[('success', 'Success'), ('error', 'Error'), ('unavailable', 'Unavailable')], default='success', max_length=12)),
+                ('cache_hit', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name': 'AI Call',
+                'verbose_name_plural': 'AI Calls',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:06
+
+import random
+import apps.quizzes.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_quiz_questions(apps, schema_editor):
+    """Turn each question's quiz and order into a QuizQuestion row and give every question its own random key"""
+    Question = apps.get_model('quizzes', 'Question')
+    QuizQuestion = apps.get_model('quizzes', 'QuizQuestion')
+    
+    links = [
+        QuizQuestion(quiz_id=quiz_id, question_id=question_id, order=order)
+        for question_id, quiz_id, order in Question.objects.filter(quiz__isnull=False).values_list('id', 'quiz_id', 'order')
+    ]
+    QuizQuestion.objects.bulk_create(links, batch_size=1000)
+    
+    questions = list(Question.objects.only('id'))
+    for question in questions:
+        question.random_key = random.random()
+    Question.objects.bulk_update(questions, ['random_key'], batch_size=1000)
+
+
+def unlink_quiz_questions(apps, schema_editor):
+    """Copy the first quiz and position of each question back onto it"""
+    Question = apps.get_model('quizzes', 'Question')
+    QuizQuestion = apps.get_model('quizzes', 'QuizQuestion')
+    
+    for link in QuizQuestion.objects.order_by('-id'):
+        Question.objects.filter(pk=link.question_id).update(quiz_id=link.quiz_id, order=link.order)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0011_add_ai_call_log'),
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='QuizQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_links', to='quizzes.question')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_questions', to='quizzes.quiz')),
+            ],
+            options={
+                'verbose_name': 'Quiz Question',
+                'verbose_name_plural': 'Quiz Questions',
+                'ordering': ['order'],
+                'unique_together': {('quiz', 'question')},
+            },
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='random_key',
+            field=models.FloatField(default=apps.quizzes.models.random_sort_key, help_text='Uniform random sort key for sampling the bank with an index range scan'),
+        ),
+        migrations.RunPython(link_quiz_questions, unlink_quiz_questions),
+        migrations.AlterModelOptions(
+            name='question',
+            options={'ordering': ['id'], 'verbose_name': 'Question', 'verbose_name_plural': 'Questions'},
+        ),
+        migrations.AlterModelOptions(
+            name='useranswer',
+            options={'ordering': ['id'], 'verbose_name': 'User Answer', 'verbose_name_plural': 'User Answers'},
+        ),
+        migrations.RemoveIndex(
+            model_name='question',
+            name='quizzes_que_categor_99f0ab_idx',
+        ),
+        migrations.RemoveField(
+            model_name='question',
+            name='order',
+        ),
+        migrations.RemoveField(
+            model_name='question',
+            name='quiz',
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['category', 'subcategory', 'difficulty', 'random_key'], name='quizzes_que_categor_f3fe21_idx'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='questions',
+            field=models.ManyToManyField(blank=True, related_name='quizzes', through='quizzes.QuizQuestion', to='quizzes.question'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quizzes', '0012_quiz_question_bank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenQuestionFilter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bits', models.BinaryField()),
+                ('num_items', models.PositiveIntegerField(default=0, help_text='Questions added since the filter was last cleared')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='seen_question_filter', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Seen Question Filter',
+                'verbose_name_plural': 'Seen Question Filters',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_question_count(apps, schema_editor):
+    """Count the linked questions of every existing quiz"""
+    Quiz = apps.get_model('quizzes', 'Quiz')
+    QuizQuestion = apps.get_model('quizzes', 'QuizQuestion')
+    links = QuizQuestion.objects.filter(quiz=models.OuterRef('pk')).order_by().values('quiz')
+    Quiz.objects.update(
+        question_count=Coalesce(
+            models.Subquery(links.annotate(total=models.Count('id')).values('total')[:1]),
+            0
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0013_add_seen_question_filter'),
+    ]
+    
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of linked questions, maintained on QuizQuestion insert and delete'),
+        ),
+        migrations.RunPython(backfill_question_count, migrations.RunPython.noop),
+    ]
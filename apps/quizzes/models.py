@@ -2,6 +2,7 @@
 Models for quiz system
 """
 
+import random
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -11,6 +12,11 @@ from django.utils.text import slugify
 User = get_user_model()
 
 
+def random_sort_key():
+    """Return a uniform random key in [0, 1) for sampling rows by index"""
+    return random.random()
+
+
 class Category(models.Model):
     """
     Quiz categories (Academic, Entertainment, General Knowledge, etc.)
@@ -85,6 +91,12 @@ class Quiz(models.Model):
         ('hard', 'Hard'),
     ]
     
+    GENERATION_STATUS_CHOICES = [
+        ('ready', 'Ready'),
+        ('generating', 'Generating'),
+        ('failed', 'Failed'),
+    ]
+    
     title = models.CharField(max_length=200)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='quizzes')
     subcategory = models.ForeignKey(Subcategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='quizzes')
@@ -103,7 +115,18 @@ class Quiz(models.Model):
     )
     
     is_active = models.BooleanField(default=True)
+    generation_status = models.CharField(
+        max_length=10,
+        choices=GENERATION_STATUS_CHOICES,
+        default='ready',
+        help_text='Whether questions are still being streamed in by the AI'
+    )
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_quizzes')
+    questions = models.ManyToManyField('Question', through='QuizQuestion', related_name='quizzes', blank=True)
+    question_count = models.PositiveIntegerField(
+        default=0,
+        help_text='Number of linked questions, maintained on QuizQuestion insert and delete'
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -119,7 +142,28 @@ class Quiz(models.Model):
     @property
     def total_questions(self):
         """Return total number of questions"""
-        return self.questions.count()
+        return self.question_count
+    
+    def get_questions(self, after=0):
+        """
+        Return the quiz's questions in quiz order
+        
+        Each question carries its position in this quiz as question.order.
+        
+        Args:
+            after (int): Only return questions placed after this position
+        """
+        links = self.quiz_questions.filter(order__gt=after).select_related('question').order_by('order')
+        questions = []
+        for link in links:
+            link.question.order = link.order
+            questions.append(link.question)
+        return questions
+    
+    @property
+    def is_generating(self):
+        """Return True while questions are still being streamed in"""
+        return self.generation_status == 'generating'
     
     @property
     def total_attempts(self):
@@ -130,8 +174,14 @@ class Quiz(models.Model):
 class Question(models.Model):
     """
     Question model for quiz questions
+    
+    Questions form a reusable bank per (category, subcategory, difficulty)
+    cell. Quizzes sample from the bank and reference the questions through
+    QuizQuestion, so one question can appear in many quizzes.
     """
-    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='questions')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='questions')
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='questions')
+    difficulty = models.CharField(max_length=10, choices=Quiz.DIFFICULTY_CHOICES, default='medium')
     question_text = models.TextField()
     option_a = models.CharField(max_length=500)
     option_b = models.CharField(max_length=500)
@@ -147,18 +197,84 @@ class Question(models.Model):
         ]
     )
     explanation = models.TextField(blank=True, help_text='Explanation for the correct answer')
-    order = models.IntegerField(default=0)
+    distractor_rationales = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Why each wrong option is wrong, keyed by option letter'
+    )
+    random_key = models.FloatField(
+        default=random_sort_key,
+        help_text='Uniform random sort key for sampling the bank with an index range scan'
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['order', 'id']
+        ordering = ['id']
         verbose_name = 'Question'
         verbose_name_plural = 'Questions'
+        indexes = [
+            models.Index(fields=['category', 'subcategory', 'difficulty', 'random_key']),
+        ]
     
     def __str__(self):
-        return f"Q{self.order}: {self.question_text[:50]}"
+        return f"Q{self.pk}: {self.question_text[:50]}"
+    
+    @staticmethod
+    def validate_generated(data):
+        """
+        Check a question dict from the AI or an import file
+        
+        It needs string 'question' and 'explanation' fields, string options
+        A to D and a correct_answer among them. Optional 'rationales' are
+        trimmed to those of wrong options, in place.
+        
+        Returns:
+            bool: True if from_generated can build a question from it
+        """
+        required_fields = ['question', 'options', 'correct_answer', 'explanation']
+        if not isinstance(data, dict) or not all(field in data for field in required_fields):
+            return False
+        
+        # Texts must be strings; parsers pass through any JSON value
+        if not isinstance(data['question'], str) or not isinstance(data['explanation'], str):
+            return False
+        
+        options = data['options']
+        if not isinstance(options, dict) or not all(isinstance(options.get(key), str) for key in 'ABCD'):
+            return False
+        
+        if data['correct_answer'] not in ('A', 'B', 'C', 'D'):
+            return False
+        
+        # Rationales are optional; keep only those for wrong options
+        rationales = data.get('rationales')
+        if isinstance(rationales, dict):
+            data['rationales'] = {
+                key: str(text).strip()
+                for key, text in rationales.items()
+                if key in options and key != data['correct_answer'] and text
+            }
+        else:
+            data.pop('rationales', None)
+        
+        return True
+    
+    @classmethod
+    def from_generated(cls, data, **fields):
+        """Build an unsaved question from an AI-generated question dict"""
+        return cls(
+            question_text=data['question'],
+            option_a=data['options']['A'],
+            option_b=data['options']['B'],
+            option_c=data['options']['C'],
+            option_d=data['options']['D'],
+            correct_answer=data['correct_answer'],
+            explanation=data.get('explanation', ''),
+            distractor_rationales=data.get('rationales', {}),
+            **fields
+        )
     
     def get_options(self):
         """Return all options as a dictionary"""
@@ -170,6 +286,84 @@ class Question(models.Model):
         }
 
 
+class QuizQuestion(models.Model):
+    """
+    A bank question placed in a quiz
+    """
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='quiz_questions')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='quiz_links')
+    order = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['order']
+        verbose_name = 'Quiz Question'
+        verbose_name_plural = 'Quiz Questions'
+        unique_together = ['quiz', 'question']
+    
+    def __str__(self):
+        return f"{self.quiz_id} Q{self.order}: {self.question_id}"
+
+
+class QuestionFingerprint(models.Model):
+    """
+    One LSH band bucket of a question's MinHash signature
+    
+    Questions sharing a bucket within a category are near-duplicate
+    candidates, see services.duplicate_service.
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='fingerprints')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='question_fingerprints')
+    bucket = models.BigIntegerField()
+    
+    class Meta:
+        verbose_name = 'Question Fingerprint'
+        verbose_name_plural = 'Question Fingerprints'
+        indexes = [
+            models.Index(fields=['category', 'bucket']),
+        ]
+    
+    def __str__(self):
+        return f"{self.question_id}: {self.bucket}"
+
+
+class AICallLog(models.Model):
+    """
+    One AI call in the usage ledger: an upstream completion, or a request
+    served from cache without one (see services.ledger)
+    """
+    OUTCOME_SUCCESS = 'success'
+    OUTCOME_ERROR = 'error'
+    OUTCOME_UNAVAILABLE = 'unavailable'
+    OUTCOME_CHOICES = [
+        (OUTCOME_SUCCESS, 'Success'),
+        (OUTCOME_ERROR, 'Error'),
+        (OUTCOME_UNAVAILABLE, 'Unavailable'),
+    ]
+    
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    endpoint = models.CharField(max_length=40)
+    category = models.CharField(max_length=100, blank=True)
+    model = models.CharField(max_length=50, blank=True)
+    items = models.PositiveIntegerField(default=0, help_text='Questions or explanations asked for')
+    
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    
+    outcome = models.CharField(max_length=12, choices=OUTCOME_CHOICES, default=OUTCOME_SUCCESS)
+    cache_hit = models.BooleanField(default=False)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'AI Call'
+        verbose_name_plural = 'AI Calls'
+    
+    def __str__(self):
+        return f"{self.endpoint} ({self.model or 'cache'}) at {self.created_at}"
+
+
 class UserQuizAttempt(models.Model):
     """
     Track user quiz attempts
@@ -246,7 +440,7 @@ class UserAnswer(models.Model):
     answered_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['question__order']
+        ordering = ['id']
         verbose_name = 'User Answer'
         verbose_name_plural = 'User Answers'
         unique_together = ['attempt', 'question']
@@ -255,9 +449,55 @@ class UserAnswer(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.attempt.user.username} - Q{self.question.order}: {self.selected_answer}"
+        return f"{self.attempt.user.username} - Q{self.question_id}: {self.selected_answer}"
     
     def save(self, *args, **kwargs):
         """Check if answer is correct before saving"""
         self.is_correct = (self.selected_answer == self.question.correct_answer)
         super().save(*args, **kwargs)
+
+
+class SeenQuestionFilter(models.Model):
+    """
+    Bloom filter over the ids of the questions a user has been quizzed on
+    
+    Quiz sampling checks bank questions against it to prefer unseen ones,
+    see services.seen_service.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='seen_question_filter')
+    bits = models.BinaryField()
+    num_items = models.PositiveIntegerField(default=0, help_text='Questions added since the filter was last cleared')
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Seen Question Filter'
+        verbose_name_plural = 'Seen Question Filters'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.num_items} questions"
+
+
+class AnswerExplanation(models.Model):
+    """
+    Shared AI explanation for choosing a specific wrong option on a question
+    Every student who picks the same wrong option is served the same text
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='answer_explanations')
+    selected_answer = models.CharField(max_length=1, choices=[
+        ('A', 'Option A'),
+        ('B', 'Option B'),
+        ('C', 'Option C'),
+        ('D', 'Option D'),
+    ])
+    explanation = models.TextField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Answer Explanation'
+        verbose_name_plural = 'Answer Explanations'
+        unique_together = ['question', 'selected_answer']
+    
+    def __str__(self):
+        return f"Q{self.question_id} - {self.selected_answer}"
@@ -1,196 +1,951 @@
 """
 AI Service for generating quiz questions using OpenAI GPT-3.5 Turbo
+(or any backend selected with AI_PROVIDER, see llm_providers)
 """
 
-from openai import OpenAI
 import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from django.conf import settings
 from django.core.cache import cache
+from apps.quizzes.models import AICallLog, Question
+from apps.quizzes.services import metrics
+from apps.quizzes.services.ledger import ai_call_ledger
+from apps.quizzes.services.llm_providers import LLMResponse, get_provider
+from apps.quizzes.services.model_router import ai_model_router
+from apps.quizzes.services.rate_limiter import PRIORITY_GENERATION, PRIORITY_INTERACTIVE, ai_rate_limiter
+from apps.quizzes.services.resilience import AIServiceUnavailable, ai_circuit_breaker, call_with_retries
+from apps.quizzes.services.singleflight import single_flight
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Hedged calls share one bounded pool. Every running future holds a slot,
+# so a call that finds none free runs unhedged instead of queueing
+_hedge_executor = ThreadPoolExecutor(max_workers=settings.AI_HEDGE_MAX_WORKERS, thread_name_prefix='ai-hedge')
+_hedge_slots = threading.BoundedSemaphore(settings.AI_HEDGE_MAX_WORKERS)
+
+
+class QuestionStreamParser:
+    """
+    Incremental parser for a JSON array of question objects
+    
+    Text can be fed in arbitrary pieces as the completion arrives; every
+    top-level object inside the array is returned as soon as its closing
+    brace is seen, so callers never wait for the whole array.
+    """
+    
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_array = False
+        self._in_string = False
+        self._escape = False
+    
+    def feed(self, text):
+        """
+        Consume more text and return the objects completed by it
+        """
+        self._buffer += text
+        objects = []
+        
+        while self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+            
+            # Objects that arrive without the surrounding array are accepted too
+            if not self._in_array and char == '{':
+                self._in_array = True
+            
+            if not self._in_array:
+                self._in_array = (char == '[')
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif char == '}' and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = self._buffer[self._start:self._pos + 1]
+                    self._start = None
+                    try:
+                        objects.append(json.loads(raw))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed question object: {str(e)}")
+            
+            self._pos += 1
+        
+        # Drop text that can no longer be part of an object
+        keep_from = self._pos if self._start is None else self._start
+        self._buffer = self._buffer[keep_from:]
+        self._pos -= keep_from
+        if self._start is not None:
+            self._start = 0
+        
+        return objects
+    
+    def close(self):
+        """
+        Signal the end of the text; an unfinished object is discarded
+        """
+        return []
+
+
+class CompactQuestionParser:
+    """
+    Incremental parser for the compact, line-delimited question format
+    
+    Each line is one positional JSON array:
+    
+        ["question", "A", "B", "C", "D", "correct letter", "explanation",
+         ["rationale", "rationale", "rationale"]]
+    
+    with the rationales given for the wrong options in letter order, and
+    the difficulty level as a ninth element in multi-variant responses. Lines
+    are parsed as soon as they end; a line cut off by the token limit or
+    otherwise malformed is skipped.
+    """
+    
+    def __init__(self):
+        self._buffer = ''
+    
+    def feed(self, text):
+        """
+        Consume more text and return the questions completed by it
+        """
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        return [question for question in map(self._parse_line, lines) if question]
+    
+    def close(self):
+        """
+        Signal the end of the text and parse a final line without newline
+        """
+        question = self._parse_line(self._buffer)
+        self._buffer = ''
+        return [question] if question else []
+    
+    def _parse_line(self, line):
+        line = line.strip().rstrip(',')
+        if not line.startswith('['):
+            return None
+        
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed compact question line: {str(e)}")
+            return None
+        
+        if not isinstance(row, list) or len(row) < 7:
+            return None
+        
+        correct_answer = str(row[5]).strip().upper()[:1]
+        wrong_options = [key for key in 'ABCD' if key != correct_answer]
+        rationales = row[7] if len(row) > 7 and isinstance(row[7], list) else []
+        
+        question = {
+            'question': row[0],
+            'options': dict(zip('ABCD', row[1:5])),
+            'correct_answer': correct_answer,
+            'explanation': row[6],
+            'rationales': dict(zip(wrong_options, rationales)),
+        }
+        if len(row) > 8:
+            question['difficulty'] = str(row[8]).strip().lower()
+        return question
+
 
 class AIQuestionGenerator:
     """
     Service class for generating quiz questions using AI
     """
     
+    DIFFICULTY_DESCRIPTIONS = {
+        'easy': 'basic and straightforward',
+        'medium': 'moderate complexity requiring some knowledge',
+        'hard': 'advanced and challenging'
+    }
+    
+    EXPLANATION_UNAVAILABLE = "Unable to generate explanation at this time. Please try again later."
+    
+    EXPLANATION_INSTRUCTIONS = """You are a helpful and encouraging teacher explaining quiz answers to students.
+
+For each incorrect answer, provide a clear, concise explanation (2-3 sentences) that:
+1. Explains why the correct answer is correct
+2. Explains why the student's answer was incorrect
+3. Helps the student understand the concept better
+
+Keep the explanation educational and encouraging."""
+    
+    EXPLANATION_BATCH_INSTRUCTIONS = EXPLANATION_INSTRUCTIONS + """
+
+The incorrect answers come as numbered items. Explain EACH item and return ONLY a JSON object
+mapping each item number to its explanation, e.g. {"1": "...", "2": "..."}"""
+    
     def __init__(self):
-        """Initialize settings (client will be lazy loaded)"""
-        self._client = None
-        self.model = settings.OPENAI_MODEL
+        """Initialize settings (provider will be lazy loaded)"""
+        self._provider = None
         self.max_tokens = settings.OPENAI_MAX_TOKENS
         self.temperature = settings.OPENAI_TEMPERATURE
+        self.response_format = settings.AI_RESPONSE_FORMAT
+        self.tokens_used = 0  # by this process, for throughput reports
+        self._usage_lock = threading.Lock()
     
     @property
-    def client(self):
-        """Lazy load OpenAI client to avoid import-time initialization issues"""
-        if self._client is None:
-            self._client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        return self._client
+    def provider(self):
+        """Lazy load the LLM provider selected by AI_PROVIDER"""
+        if self._provider is None:
+            self._provider = get_provider()
+        return self._provider
+    
+    def is_configured(self):
+        """Return True if the AI backend can serve requests"""
+        return self.provider.is_configured()
+    
+    def is_available(self):
+        """Return True if the AI backend is configured and its circuit is closed"""
+        return self.is_configured() and not ai_circuit_breaker.is_open
+    
+    def _complete(self, messages, max_tokens, temperature, priority, user_id=None, **hints):
+        """
+        Run a provider completion through the shared rate limiter, with
+        bounded retries behind the circuit breaker
+        
+        The model router picks the model of the task. A call still running
+        at its model's hedge deadline gets a duplicate request, to the
+        fastest model of the task, and the first result wins. Both share
+        the call's AI_REQUEST_DEADLINE, so the loser is cut off with it.
+        
+        Raises:
+            AIServiceUnavailable: The breaker is open, every attempt failed,
+                or the rate limiter gave no slot (RateLimitExceeded)
+        """
+        estimated_tokens = self._estimate_tokens(messages, max_tokens)
+        try:
+            ai_rate_limiter.acquire(priority, estimated_tokens, user_id)
+        except AIServiceUnavailable:
+            self._record_call(hints, outcome=AICallLog.OUTCOME_UNAVAILABLE)
+            raise
+        
+        deadline = time.monotonic() + settings.AI_REQUEST_DEADLINE
+        task = hints.get('task')
+        model, hedge_model, hedge_delay = ai_model_router.route(task)
+        if hedge_model is None or not _hedge_slots.acquire(blocking=False):
+            return self._call_model(model, messages, max_tokens, temperature, estimated_tokens, user_id, hints, deadline)
+        
+        primary = self._submit_hedged(model, messages, max_tokens, temperature, estimated_tokens, user_id, hints, deadline)
+        pending = {primary}
+        done, _ = wait(pending, timeout=hedge_delay)
+        
+        # Hedges are optional load: they need enough of the deadline left, a
+        # free pool slot, and a rate limit slot without queueing
+        if (not done
+                and deadline - time.monotonic() >= settings.AI_HEDGE_MIN_BUDGET
+                and _hedge_slots.acquire(blocking=False)):
+            if ai_rate_limiter.try_acquire(priority, estimated_tokens):
+                logger.info(f"Hedging {task} call to {model} after {hedge_delay:.2f}s with {hedge_model}")
+                metrics.record_count('ai_hedged_requests')
+                # The user is charged for the primary call only
+                pending.add(self._submit_hedged(
+                    hedge_model, messages, max_tokens, temperature, estimated_tokens, None, hints, deadline
+                ))
+            else:
+                _hedge_slots.release()
+        
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        metrics.record_count('ai_hedge_wins')
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+    
+    def _submit_hedged(self, *args):
+        """
+        Run _call_model on the hedge pool, holding an already acquired
+        slot until the call is done
+        """
+        future = _hedge_executor.submit(self._call_model, *args)
+        future.add_done_callback(lambda _: _hedge_slots.release())
+        return future
     
-    def generate_questions(self, category, subcategory, difficulty, num_questions=10):
+    def _call_model(self, model, messages, max_tokens, temperature, estimated_tokens, user_id, hints, deadline=None):
+        """
+        Run one completion on a model, recording its latency and usage
+        """
+        started_at = time.monotonic()
+        try:
+            response = call_with_retries(
+                lambda timeout: self.provider.complete(
+                    messages, max_tokens=max_tokens, temperature=temperature, model=model, timeout=timeout, **hints
+                ),
+                self.provider.retryable_errors,
+                ai_circuit_breaker,
+                deadline
+            )
+        except AIServiceUnavailable:
+            self._record_call(hints, model, time.monotonic() - started_at, outcome=AICallLog.OUTCOME_UNAVAILABLE)
+            raise
+        except Exception:
+            self._record_call(hints, model, time.monotonic() - started_at, outcome=AICallLog.OUTCOME_ERROR)
+            raise
+        
+        latency = time.monotonic() - started_at
+        ai_model_router.record(model, hints.get('task'), latency)
+        self._record_usage(estimated_tokens, response, user_id)
+        self._record_call(hints, model, latency, response)
+        return response
+    
+    def _stream(self, messages, max_tokens, temperature, priority, user_id=None, **hints):
+        """
+        Stream a provider completion through the rate limiter, behind the
+        circuit breaker
+        
+        Streams are not retried: text already yielded cannot be taken back.
+        Every delta must arrive within AI_READ_TIMEOUT. A consumer that
+        stops reading (closes the generator) ends the upstream stream; what
+        it delivered so far is still recorded.
+        """
+        estimated_tokens = self._estimate_tokens(messages, max_tokens)
+        try:
+            ai_rate_limiter.acquire(priority, estimated_tokens, user_id)
+            ai_circuit_breaker.before_call()
+        except AIServiceUnavailable:
+            self._record_call(hints, outcome=AICallLog.OUTCOME_UNAVAILABLE, stream=True)
+            raise
+        
+        model = ai_model_router.models(hints.get('task'))[0]
+        streamed = 0
+        started_at = time.monotonic()
+        stream = self.provider.stream(
+            messages, max_tokens=max_tokens, temperature=temperature, model=model,
+            timeout=settings.AI_READ_TIMEOUT, **hints
+        )
+        try:
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as done:
+                    # Providers return the call's usage when the stream ends
+                    usage = done.value
+                    break
+                
+                if not streamed:
+                    metrics.record_timing('ai_time_to_first_token', time.monotonic() - started_at)
+                streamed += len(delta)
+                yield delta
+        except self.provider.retryable_errors as e:
+            ai_circuit_breaker.record_failure()
+            self._record_call(
+                hints, model, time.monotonic() - started_at, outcome=AICallLog.OUTCOME_UNAVAILABLE, stream=True
+            )
+            raise AIServiceUnavailable(f"AI service unavailable: {str(e)}") from e
+        except GeneratorExit:
+            stream.close()
+            if streamed:
+                ai_circuit_breaker.record_success()
+            self._record_stream_usage(messages, model, estimated_tokens, streamed, None, user_id, hints, started_at)
+            raise
+        except Exception:
+            # The upstream answered; a bad request is not an outage
+            ai_circuit_breaker.record_success()
+            raise
+        finally:
+            ai_circuit_breaker.release_trial()
+        ai_circuit_breaker.record_success()
+        self._record_stream_usage(messages, model, estimated_tokens, streamed, usage, user_id, hints, started_at)
+    
+    def _record_stream_usage(self, messages, model, estimated_tokens, streamed, usage, user_id, hints, started_at):
+        """
+        Record the usage of a stream, estimated from its length when the
+        provider reported none
+        """
+        if usage is None:
+            usage = LLMResponse(
+                '', model,
+                prompt_tokens=self._estimate_tokens(messages, 0),
+                completion_tokens=streamed // 4
+            )
+        self._record_usage(estimated_tokens, usage, user_id)
+        self._record_call(hints, model, time.monotonic() - started_at, usage, stream=True)
+    
+    def _record_call(self, hints, model='', latency=0.0, response=None, outcome=AICallLog.OUTCOME_SUCCESS,
+                     stream=False):
+        """
+        Write an upstream call to the AI call ledger, described by its hints
+        """
+        endpoint = 'question_variants' if hints.get('variants') else hints.get('task', '')
+        ai_call_ledger.record(
+            f"{endpoint}_stream" if stream else endpoint,
+            category=hints.get('category'),
+            model=model,
+            items=hints.get('num_questions') or len(hints.get('items') or ()) or 1,
+            response=response,
+            latency=latency,
+            outcome=outcome,
+        )
+    
+    def _record_usage(self, estimated_tokens, response, user_id=None):
+        """
+        Charge the real token usage of a call to the rate limiter and the
+        process total, and record how much of the prompt the provider served
+        from its prompt cache
+        """
+        actual_tokens = response.prompt_tokens + response.completion_tokens
+        ai_rate_limiter.settle(estimated_tokens, actual_tokens, user_id)
+        with self._usage_lock:
+            self.tokens_used += actual_tokens
+        
+        metrics.record_count('ai_prompt_tokens', response.prompt_tokens)
+        metrics.record_count('ai_cached_prompt_tokens', response.cached_tokens)
+        logger.info(
+            f"AI usage: {response.prompt_tokens} prompt tokens ({response.cached_tokens} cached), "
+            f"{response.completion_tokens} completion tokens"
+        )
+    
+    def _estimate_tokens(self, messages, max_tokens):
+        """Rough token count of a call: the prompt (about four characters per token) plus max_tokens"""
+        return sum(len(message['content']) for message in messages) // 4 + max_tokens
+    
+    def generate_questions(self, category, subcategory, difficulty, num_questions=10,
+                           priority=PRIORITY_GENERATION, user_id=None):
         """
         Generate quiz questions based on parameters
         
+        Every call yields a fresh set: generated questions are saved to the
+        bank, and concurrent quizzes of one cell share them through it
+        (see QuizService.get_or_create_quiz).
+        
         Args:
             category (str): Quiz category
             subcategory (str): Quiz subcategory
             difficulty (str): Difficulty level (easy, medium, hard)
             num_questions (int): Number of questions to generate
+            priority (str): Rate limiter priority class of the calls
+            user_id (int): User charged against the per-user AI quota
         
         Returns:
             list: List of question dictionaries
         """
-        # Check cache first
-        cache_key = f"quiz_questions_{category}_{subcategory}_{difficulty}_{num_questions}"
-        cached_questions = cache.get(cache_key)
+        return self._request_questions(category, subcategory, difficulty, num_questions, priority, user_id)
+    
+    def _request_questions(self, category, subcategory, difficulty, num_questions,
+                           priority=PRIORITY_GENERATION, user_id=None):
+        """
+        Call the AI for a fresh set of questions
         
-        if cached_questions:
-            logger.info(f"Retrieved {num_questions} questions from cache")
-            return cached_questions
+        Requests larger than OPENAI_CHUNK_SIZE are split into chunks that run
+        concurrently, so wall-clock time follows the chunk size rather than
+        the quiz size. Questions lost to failed or truncated responses, or
+        repeated across chunks, are requested once more; only the shortfall
+        is asked for.
+        """
+        if num_questions <= settings.OPENAI_CHUNK_SIZE:
+            questions = self._dedupe_questions(
+                self._request_question_chunk(category, subcategory, difficulty, num_questions, None, priority, user_id)
+            )
+        else:
+            questions = self._request_chunks_parallel(category, subcategory, difficulty, num_questions, priority, user_id)
         
-        # Generate prompt
-        prompt = self._create_prompt(category, subcategory, difficulty, num_questions)
+        missing = num_questions - len(questions)
+        if missing > 0:
+            logger.info(f"Topping up {missing} questions lost to failed, truncated or duplicate responses")
+            try:
+                extra = self._request_chunks_parallel(category, subcategory, difficulty, missing, priority, user_id)
+                questions = self._dedupe_questions(questions + extra)
+            except Exception as e:
+                if not questions:
+                    raise
+                logger.warning(f"Top-up request failed: {str(e)}")
+        
+        return questions[:num_questions]
+    
+    def _request_chunks_parallel(self, category, subcategory, difficulty, num_questions,
+                                 priority=PRIORITY_GENERATION, user_id=None):
+        """
+        Generate num_questions as concurrent chunk requests and merge them
+        
+        Returns:
+            list: De-duplicated questions from every chunk that succeeded
+        """
+        chunk_size = settings.OPENAI_CHUNK_SIZE
+        sizes = [min(chunk_size, num_questions - start) for start in range(0, num_questions, chunk_size)]
+        workers = min(settings.OPENAI_MAX_CONCURRENCY, len(sizes))
         
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self._request_question_chunk,
+                    category, subcategory, difficulty, size,
+                    (part, len(sizes)) if len(sizes) > 1 else None,
+                    priority, user_id
+                )
+                for part, size in enumerate(sizes, start=1)
+            ]
+        
+        questions = []
+        errors = []
+        for future in futures:
+            try:
+                questions.extend(future.result())
+            except Exception as e:
+                errors.append(e)
+        
+        if not questions and errors:
+            raise errors[0]
+        if errors:
+            logger.warning(f"{len(errors)} of {len(sizes)} question chunks failed")
+        
+        return self._dedupe_questions(questions)
+    
+    def _dedupe_questions(self, questions):
+        """
+        Drop questions whose normalized text was already seen
+        """
+        seen = set()
+        unique = []
+        for question in questions:
+            key = self._question_key(question)
+            if key not in seen:
+                seen.add(key)
+                unique.append(question)
+        return unique
+    
+    def _question_key(self, question):
+        """Normalized question text used to spot exact repeats"""
+        return ''.join(ch for ch in question['question'].lower() if ch.isalnum())
+    
+    def _request_question_chunk(self, category, subcategory, difficulty, num_questions, part=None,
+                                priority=PRIORITY_GENERATION, user_id=None):
+        """
+        Call the AI once for num_questions questions
+        
+        Args:
+            part (tuple): (index, total) when this call is one chunk of a
+                larger request, used to steer chunks toward different areas
+        """
         try:
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert quiz question generator. Generate high-quality, accurate multiple-choice questions in JSON format."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
+            # Call AI provider
+            response = self._complete_questions(
+                category, subcategory, difficulty, num_questions, part, priority, user_id
             )
             
             # Parse response
-            content = response.choices[0].message.content.strip()
+            content = response.text.strip()
             questions = self._parse_questions(content)
             
-            # Cache the questions
-            cache.set(cache_key, questions, settings.QUIZ_QUESTIONS_CACHE_TIMEOUT)
-            
+            if response.finish_reason == 'length':
+                logger.warning(f"Response hit the token limit, salvaged {len(questions)} of {num_questions} questions")
             logger.info(f"Generated {len(questions)} questions using AI")
             return questions
             
+        except AIServiceUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating questions: {str(e)}")
             raise Exception(f"Failed to generate questions: {str(e)}")
     
-    def _create_prompt(self, category, subcategory, difficulty, num_questions):
+    def _complete_questions(self, category, subcategory, difficulty, num_questions, part=None,
+                            priority=PRIORITY_GENERATION, user_id=None):
         """
-        Create prompt for AI question generation
+        Run one question generation completion
+        
+        Returns:
+            LLMResponse: The raw response in self.response_format
         """
-        difficulty_desc = {
-            'easy': 'basic and straightforward',
-            'medium': 'moderate complexity requiring some knowledge',
-            'hard': 'advanced and challenging'
+        prompt = self._create_prompt(category, subcategory, difficulty, num_questions, part)
+        return self._complete(
+            self._question_messages(prompt),
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            priority=priority,
+            user_id=user_id,
+            **self._question_hints(category, subcategory, difficulty, num_questions)
+        )
+    
+    def _question_hints(self, category, subcategory, difficulty, num_questions):
+        """Provider hints describing a question generation prompt"""
+        return {
+            'task': 'questions',
+            'category': category,
+            'topic': subcategory or category,
+            'difficulty': difficulty,
+            'num_questions': num_questions,
+            'response_format': self.response_format,
         }
+    
+    def generate_question_variants(self, category, subcategory, counts,
+                                   priority=PRIORITY_GENERATION, user_id=None):
+        """
+        Generate questions for several difficulty levels of one topic in
+        shared completions instead of one generation per level
         
-        prompt = f"""Generate {num_questions} multiple-choice quiz questions about {subcategory or category}.
+        Args:
+            category (str): Quiz category
+            subcategory (str): Quiz subcategory
+            counts (dict): Number of questions by difficulty level,
+                e.g. {'easy': 10, 'medium': 10, 'hard': 10}
+            priority (str): Rate limiter priority class of the calls
+            user_id (int): User charged against the per-user AI quota
+        
+        Returns:
+            dict: List of question dictionaries by difficulty level
+        """
+        return self._request_variants(category, subcategory, counts, priority, user_id)
+    
+    def _request_variants(self, category, subcategory, counts, priority=PRIORITY_GENERATION, user_id=None):
+        """
+        Call the AI for fresh questions of several difficulty levels
+        
+        Every call asks for up to OPENAI_CHUNK_SIZE questions per level and
+        the calls run concurrently. Levels that come back short are topped
+        up once, again in shared calls for the shortfall only.
+        """
+        questions = self._request_variant_chunks_parallel(category, subcategory, counts, priority, user_id)
+        
+        missing = {
+            difficulty: count - len(questions[difficulty])
+            for difficulty, count in counts.items()
+            if count > len(questions[difficulty])
+        }
+        if missing:
+            logger.info(f"Topping up {sum(missing.values())} questions lost to failed, truncated or duplicate responses")
+            try:
+                extra = self._request_variant_chunks_parallel(
+                    category, subcategory, missing, priority, user_id, seen=questions
+                )
+                for difficulty in missing:
+                    questions[difficulty] += extra[difficulty]
+            except Exception as e:
+                if not any(questions.values()):
+                    raise
+                logger.warning(f"Top-up request failed: {str(e)}")
+        
+        return {difficulty: questions[difficulty][:count] for difficulty, count in counts.items()}
+    
+    def _request_variant_chunks_parallel(self, category, subcategory, counts, priority=PRIORITY_GENERATION,
+                                         user_id=None, seen=None):
+        """
+        Generate counts as concurrent multi-level chunk requests and split
+        the questions by their difficulty tag
+        
+        Args:
+            seen (dict): Questions by level already kept, which the new
+                ones must not repeat
+        
+        Returns:
+            dict: De-duplicated questions by difficulty level
+        """
+        chunk_size = settings.OPENAI_CHUNK_SIZE
+        chunks = []
+        for start in range(0, max(counts.values()), chunk_size):
+            chunk = {
+                difficulty: min(chunk_size, count - start)
+                for difficulty, count in counts.items() if count > start
+            }
+            chunks.append(chunk)
+        workers = min(settings.OPENAI_MAX_CONCURRENCY, len(chunks))
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self._request_variant_chunk,
+                    category, subcategory, chunk,
+                    (part, len(chunks)) if len(chunks) > 1 else None,
+                    priority, user_id
+                )
+                for part, chunk in enumerate(chunks, start=1)
+            ]
+        
+        generated = []
+        errors = []
+        for future in futures:
+            try:
+                generated.extend(future.result())
+            except Exception as e:
+                errors.append(e)
+        
+        if not generated and errors:
+            raise errors[0]
+        if errors:
+            logger.warning(f"{len(errors)} of {len(chunks)} multi-level question chunks failed")
+        
+        # A question repeated across levels is kept once, at its first level
+        seen = seen or {}
+        known = {self._question_key(q) for questions in seen.values() for q in questions}
+        questions = {difficulty: [] for difficulty in counts}
+        for question in self._dedupe_questions(generated):
+            difficulty = question.pop('difficulty', None)
+            if difficulty in questions and self._question_key(question) not in known:
+                questions[difficulty].append(question)
+        
+        return questions
+    
+    def _request_variant_chunk(self, category, subcategory, counts, part=None,
+                               priority=PRIORITY_GENERATION, user_id=None):
+        """
+        Call the AI once for questions of several difficulty levels
+        
+        Returns:
+            list: Question dictionaries tagged with their 'difficulty'
+        """
+        try:
+            prompt = self._create_variants_prompt(category, subcategory, counts, part)
+            hints = self._question_hints(category, subcategory, None, sum(counts.values()))
+            response = self._complete(
+                self._question_messages(prompt),
+                # The output grows with the number of levels, up to the model's limit
+                max_tokens=min(self.max_tokens * len(counts), settings.OPENAI_MAX_COMPLETION_TOKENS),
+                temperature=self.temperature,
+                priority=priority,
+                user_id=user_id,
+                variants=counts,
+                **hints
+            )
+            
+            questions = self._parse_questions(response.text.strip())
+            if response.finish_reason == 'length':
+                logger.warning(
+                    f"Response hit the token limit, salvaged {len(questions)} of {sum(counts.values())} questions"
+                )
+            logger.info(f"Generated {len(questions)} questions for {len(counts)} difficulty levels using AI")
+            return questions
+        
+        except AIServiceUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating questions: {str(e)}")
+            raise Exception(f"Failed to generate questions: {str(e)}")
+    
+    def generate_questions_stream(self, category, subcategory, difficulty, num_questions=10, user_id=None):
+        """
+        Generate quiz questions, yielding each one as soon as it is complete
+        
+        The completion is streamed and parsed incrementally, so the first
+        question is available long before the last one is written. The
+        time to the first valid question is recorded as the
+        'ai_time_to_first_question' metric.
+        
+        Yields:
+            dict: Validated question dictionaries
+        """
+        prompt = self._create_prompt(category, subcategory, difficulty, num_questions)
+        questions = []
+        started_at = time.monotonic()
+        
+        try:
+            stream = self._stream(
+                self._question_messages(prompt),
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                priority=PRIORITY_GENERATION,
+                user_id=user_id,
+                **self._question_hints(category, subcategory, difficulty, num_questions)
+            )
+            
+            for question in self._parse_stream(stream):
+                if len(questions) >= num_questions or not Question.validate_generated(question):
+                    continue
+                
+                if not questions:
+                    metrics.record_timing('ai_time_to_first_question', time.monotonic() - started_at)
+                questions.append(question)
+                yield question
+            
+            # A truncated or partly malformed stream keeps what it delivered;
+            # only the shortfall is requested again
+            missing = num_questions - len(questions)
+            if missing > 0:
+                logger.info(f"Stream delivered {len(questions)} of {num_questions} questions, topping up {missing}")
+                seen = {self._question_key(question) for question in questions}
+                for question in self._request_questions(
+                    category, subcategory, difficulty, missing, PRIORITY_GENERATION, user_id
+                ):
+                    if self._question_key(question) not in seen and len(questions) < num_questions:
+                        seen.add(self._question_key(question))
+                        questions.append(question)
+                        yield question
+            
+        except AIServiceUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming questions: {str(e)}")
+            raise Exception(f"Failed to generate questions: {str(e)}")
+        
+        metrics.record_timing('ai_question_stream_total', time.monotonic() - started_at)
+        logger.info(f"Streamed {len(questions)} questions using AI")
+    
+    def _question_messages(self, prompt):
+        """
+        Build the chat messages for a question generation prompt
+        
+        The system message holds every static instruction and is identical
+        across calls, so providers can serve it from their prompt cache; only
+        the short user message varies.
+        """
+        return [
+            {
+                "role": "system",
+                "content": self._question_instructions()
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    def _question_instructions(self):
+        """
+        Static instructions shared by every question generation call
+        """
+        return f"""You are an expert quiz question generator. Generate high-quality, accurate multiple-choice questions.
 
 Requirements:
-- Difficulty level: {difficulty} ({difficulty_desc.get(difficulty, '')})
+- Generate exactly the number of questions asked for, about the topic and at the difficulty level given in the request
 - Each question must have exactly 4 options (A, B, C, D)
 - Only ONE option should be correct
 - Include a brief explanation for the correct answer
+- Include a one-sentence rationale for EACH wrong option explaining why it is wrong
 - Questions should be clear, unambiguous, and educational
 - Avoid trick questions or overly obscure topics
 
-Return ONLY a JSON array in this exact format:
+{self._format_instructions()}"""
+    
+    def _create_prompt(self, category, subcategory, difficulty, num_questions, part=None):
+        """
+        Create the variable part of the question generation prompt
+        """
+        difficulty_desc = self.DIFFICULTY_DESCRIPTIONS
+        
+        prompt = f"""Generate {num_questions} multiple-choice quiz questions about {subcategory or category}.
+- Difficulty level: {difficulty} ({difficulty_desc.get(difficulty, '')}){self._part_requirement(part)}"""
+        
+        return prompt
+    
+    def _create_variants_prompt(self, category, subcategory, counts, part=None):
+        """
+        Create the variable prompt part asking for several difficulty levels
+        """
+        levels = '\n'.join(
+            f"- {count} {difficulty} questions ({self.DIFFICULTY_DESCRIPTIONS.get(difficulty, '')})"
+            for difficulty, count in counts.items()
+        )
+        if self.response_format == 'compact':
+            tag = 'append its difficulty level as a last array element, e.g. "easy"'
+        else:
+            tag = 'add a "difficulty" field set to its difficulty level, e.g. "easy"'
+        
+        return f"""Generate multiple-choice quiz questions about {subcategory or category} at these difficulty levels:
+{levels}
+- Tag every question with its level: {tag}{self._part_requirement(part)}"""
+    
+    def _format_instructions(self):
+        """
+        Output format section of the question prompt for self.response_format
+        """
+        if self.response_format == 'compact':
+            return """Return ONLY one compact JSON array per line, one line per question, with no other text:
+["question", "option A", "option B", "option C", "option D", "correct letter", "explanation", ["why the 1st wrong option is wrong", "why the 2nd wrong option is wrong", "why the 3rd wrong option is wrong"]]
+Wrong options are listed in letter order. Example:
+["What is the primary purpose of Python's 'self' parameter?", "To refer to the class itself", "To refer to the instance of the class", "To create a new object", "To delete an instance", "B", "'self' refers to the instance and gives access to its attributes and methods.", ["The class is referenced with 'cls', not 'self'.", "Objects are created by calling the class.", "Instances are deleted with 'del' or garbage collection."]]"""
+        
+        return """Return ONLY a JSON array in this exact format:
 [
-    {{
+    {
         "question": "What is the primary purpose of Python's 'self' parameter?",
-        "options": {{
+        "options": {
             "A": "To refer to the class itself",
             "B": "To refer to the instance of the class",
             "C": "To create a new object",
             "D": "To delete an instance"
-        }},
+        },
         "correct_answer": "B",
-        "explanation": "The 'self' parameter refers to the instance of the class and is used to access instance variables and methods."
-    }}
-]
-
-Generate {num_questions} questions now:"""
-        
-        return prompt
+        "explanation": "The 'self' parameter refers to the instance of the class and is used to access instance variables and methods.",
+        "rationales": {
+            "A": "The class itself is referenced with 'cls' in class methods, not 'self'.",
+            "C": "New objects are created by calling the class; 'self' already exists when a method runs.",
+            "D": "Instances are deleted with 'del' or garbage collection, not through 'self'."
+        }
+    }
+]"""
     
-    def _parse_questions(self, content):
+    def _part_requirement(self, part):
         """
-        Parse AI response into question format
+        Extra prompt requirement that keeps parallel chunks from overlapping
         """
-        try:
-            # Try to find JSON in the content
-            start_idx = content.find('[')
-            end_idx = content.rfind(']') + 1
-            
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = content[start_idx:end_idx]
-                questions = json.loads(json_str)
-                
-                # Validate structure
-                validated_questions = []
-                for q in questions:
-                    if self._validate_question(q):
-                        validated_questions.append(q)
-                
-                return validated_questions
-            else:
-                raise ValueError("No JSON array found in response")
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {str(e)}")
-            raise ValueError(f"Failed to parse questions: {str(e)}")
+        if not part:
+            return ''
+        index, total = part
+        return (
+            f"\n- Divide the topic into {total} distinct areas and ask ONLY about area {index} of {total}"
+        )
     
-    def _validate_question(self, question):
+    def _parse_stream(self, deltas):
         """
-        Validate question structure
+        Yield question objects from text deltas as soon as each is complete
         """
-        required_fields = ['question', 'options', 'correct_answer', 'explanation']
-        
-        # Check required fields
-        if not all(field in question for field in required_fields):
-            return False
+        parser = CompactQuestionParser() if self.response_format == 'compact' else QuestionStreamParser()
+        for delta in deltas:
+            yield from parser.feed(delta)
+        yield from parser.close()
+    
+    def _parse_questions(self, content):
+        """
+        Parse AI response into question format
         
-        # Check options
-        options = question.get('options', {})
-        if not all(key in options for key in ['A', 'B', 'C', 'D']):
-            return False
+        Every complete, valid question object is kept, so a response cut off
+        at the token limit or broken halfway still yields the questions
+        before the damage.
+        """
+        validated_questions = [
+            q for q in self._parse_stream([content])
+            if Question.validate_generated(q)
+        ]
         
-        # Check correct answer
-        if question.get('correct_answer') not in ['A', 'B', 'C', 'D']:
-            return False
+        if not validated_questions:
+            logger.error(f"No valid questions in response: {content[:200]}")
+            raise ValueError("Failed to parse questions: no complete question objects in response")
         
-        return True
+        return validated_questions
     
     def estimate_cost(self, num_questions):
         """
         Estimate API cost for generating questions
         
-        GPT-3.5-turbo pricing (approximate):
-        - Input: $0.0015 per 1K tokens
-        - Output: $0.002 per 1K tokens
+        Uses the tokens per question of the last week's calls in the AI call
+        ledger, and AI_MODEL_PRICES for the question model. Without ledger
+        data it falls back to ~300 tokens per question, a third of them
+        prompt.
         """
-        # Rough estimate: ~300 tokens per question
-        estimated_tokens = num_questions * 300
-        estimated_cost = (estimated_tokens / 1000) * 0.002
+        tokens_per_question = ai_call_ledger.tokens_per_item('questions') or 300
+        estimated_tokens = int(num_questions * tokens_per_question)
+        estimated_cost = ai_call_ledger.cost(
+            ai_model_router.models('questions')[0],
+            estimated_tokens // 3,
+            estimated_tokens - estimated_tokens // 3
+        )
         
         return {
             'estimated_tokens': estimated_tokens,
-            'estimated_cost_usd': round(estimated_cost, 4)
+            'estimated_cost_usd': round(float(estimated_cost), 4)
         }
     
-    def generate_answer_explanation(self, question_text, selected_answer, correct_answer, options):
+    def generate_answer_explanation(self, question_text, selected_answer, correct_answer, options, dedupe_key=None,
+                                    user_id=None, category=None):
         """
         Task 3.3: Generate AI explanation for why an answer was incorrect
         
@@ -199,12 +954,43 @@ Generate {num_questions} questions now:"""
             selected_answer (str): The answer the user selected (e.g., 'A')
             correct_answer (str): The correct answer (e.g., 'C')
             options (dict): Dictionary of options {'A': 'text', 'B': 'text', ...}
+            dedupe_key (str): Identifies the question/selected option pair so
+                concurrent requests for it share a single AI call
+            user_id (int): User charged against the per-user AI quota
+            category (str): Category of the question, for the AI call ledger
         
         Returns:
             str: AI-generated explanation
         """
-        prompt = f"""
-You are a helpful teacher explaining quiz answers to students. A student answered a question incorrectly.
+        try:
+            if dedupe_key:
+                computed = []
+                
+                def compute():
+                    computed.append(True)
+                    return self._request_answer_explanation(
+                        question_text, selected_answer, correct_answer, options, user_id, category
+                    )
+                
+                explanation = single_flight(f"ai_explanation_{dedupe_key}", compute, settings.AI_EXPLANATION_CACHE_TIMEOUT)
+                if not computed:
+                    ai_call_ledger.record('explanation', category, items=1, cache_hit=True)
+                return explanation
+            return self._request_answer_explanation(
+                question_text, selected_answer, correct_answer, options, user_id, category
+            )
+            
+        except Exception as e:
+            logger.error(f"Error generating AI explanation: {str(e)}")
+            return self.EXPLANATION_UNAVAILABLE
+    
+    def _request_answer_explanation(self, question_text, selected_answer, correct_answer, options, user_id=None,
+                                    category=None):
+        """
+        Call the AI for an answer explanation, raising on failure
+        """
+        # Static instructions first so the provider can cache them as a prefix
+        prompt = f"""A student answered this question incorrectly.
 
 Question: {question_text}
 
@@ -213,33 +999,118 @@ Options:
 
 The student selected: {selected_answer}. {options.get(selected_answer, 'N/A')}
 The correct answer is: {correct_answer}. {options.get(correct_answer, 'N/A')}
-
-Please provide a clear, concise explanation (2-3 sentences) that:
-1. Explains why the correct answer is correct
-2. Explains why the student's answer was incorrect
-3. Helps the student understand the concept better
-
-Keep the explanation educational and encouraging.
 """
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful and encouraging teacher."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=250,
-                temperature=0.7
-            )
-            
-            explanation = response.choices[0].message.content.strip()
-            logger.info(f"Generated AI explanation for question")
-            return explanation
+        response = self._complete(
+            [
+                {"role": "system", "content": self.EXPLANATION_INSTRUCTIONS},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=250,
+            temperature=0.7,
+            priority=PRIORITY_INTERACTIVE,
+            user_id=user_id,
+            task='explanation',
+            category=category,
+            selected_answer=selected_answer,
+            correct_answer=correct_answer,
+        )
+        
+        explanation = response.text.strip()
+        logger.info(f"Generated AI explanation for question")
+        return explanation
+    
+    def generate_answer_explanations_batch(self, items, user_id=None, category=None):
+        """
+        Generate explanations for several incorrect answers in one completion
+        
+        Args:
+            items (list): Dictionaries with 'key' (question/selected option
+                identifier, as used for dedupe_key), 'question_text',
+                'selected_answer', 'correct_answer' and 'options'
+            user_id (int): User charged against the per-user AI quota
+            category (str): Category of the quiz, for the AI call ledger
+        
+        Returns:
+            dict: Explanation text by item key; items that could not be
+                explained are left out
+        """
+        explanations = {}
+        pending = []
+        
+        # Reuse explanations already produced for the same question/option
+        for item in items:
+            cached = cache.get(f"ai_explanation_{item['key']}")
+            if cached:
+                explanations[item['key']] = cached
+                ai_call_ledger.record('explanation_batch', category, items=1, cache_hit=True)
+            else:
+                pending.append(item)
+        
+        batch_size = settings.AI_EXPLANATION_BATCH_SIZE
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            try:
+                generated = self._request_answer_explanations_batch(batch, user_id, category)
+            except Exception as e:
+                logger.error(f"Error generating batched AI explanations: {str(e)}")
+                continue
             
-        except Exception as e:
-            logger.error(f"Error generating AI explanation: {str(e)}")
-            return "Unable to generate explanation at this time. Please try again later."
+            for item in batch:
+                explanation = generated.get(item['key'])
+                if explanation:
+                    explanations[item['key']] = explanation
+                    cache.set(f"ai_explanation_{item['key']}", explanation, settings.AI_EXPLANATION_CACHE_TIMEOUT)
+        
+        return explanations
+    
+    def _request_answer_explanations_batch(self, items, user_id=None, category=None):
+        """
+        Call the AI once for a batch of answer explanations, raising on failure
+        """
+        blocks = []
+        for number, item in enumerate(items, start=1):
+            options = item['options']
+            blocks.append(f"""Item {number}
+Question: {item['question_text']}
+Options:
+{chr(10).join([f'{key}. {value}' for key, value in options.items()])}
+The student selected: {item['selected_answer']}. {options.get(item['selected_answer'], 'N/A')}
+The correct answer is: {item['correct_answer']}. {options.get(item['correct_answer'], 'N/A')}""")
+        
+        prompt = f"""A student answered the following {len(items)} questions incorrectly.
+
+{(chr(10) * 2).join(blocks)}
+"""
+        
+        response = self._complete(
+            [
+                {"role": "system", "content": self.EXPLANATION_BATCH_INSTRUCTIONS},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=250 * len(items),
+            temperature=0.7,
+            priority=PRIORITY_INTERACTIVE,
+            user_id=user_id,
+            task='explanation_batch',
+            category=category,
+            items=items,
+        )
+        
+        content = response.text.strip()
+        start_idx = content.find('{')
+        end_idx = content.rfind('}') + 1
+        if start_idx == -1 or end_idx <= start_idx:
+            raise ValueError("No JSON object found in response")
+        
+        by_number = json.loads(content[start_idx:end_idx])
+        logger.info(f"Generated {len(by_number)} AI explanations in one batch")
+        
+        return {
+            item['key']: str(by_number[str(number)]).strip()
+            for number, item in enumerate(items, start=1)
+            if by_number.get(str(number))
+        }
 
 
 # Singleton instance
@@ -0,0 +1,159 @@
+"""
+Near-duplicate detection for generated questions
+
+Every stored question gets a MinHash signature over character shingles of
+its normalized stem and correct answer text (see services.minhash). The
+signature is cut into LSH bands, shaped from QUESTION_DUPLICATE_THRESHOLD
+(see minhash.band_shape), and each band is stored as one
+QuestionFingerprint bucket, indexed by (category, bucket). Questions that
+share any bucket are candidates; a candidate is a duplicate when the Jaccard
+similarity of the two shingle sets reaches QUESTION_DUPLICATE_THRESHOLD.
+
+A lookup is a single indexed IN query for the whole batch, so it stays fast
+as the question table grows.
+"""
+
+from django.conf import settings
+from apps.quizzes.models import Question, QuestionFingerprint
+from apps.quizzes.services import minhash
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Question fields fingerprint_text reads
+FINGERPRINT_FIELDS = ('id', 'question_text', 'correct_answer', 'option_a', 'option_b', 'option_c', 'option_d')
+
+
+class DuplicateDetectionService:
+    """
+    Service class for near-duplicate question detection
+    """
+    
+    @staticmethod
+    def fingerprint_text(question):
+        """
+        Return the text a question is compared by: its stem followed by the
+        text of its correct answer
+        
+        The stem alone does not tell questions apart: "In which year did
+        World War I begin?" and "In which year did World War II end?" share
+        most of their shingles, but not their answers.
+        
+        Args:
+            question: Generated question dict or Question object
+        """
+        if isinstance(question, dict):
+            return f"{question['question']} {question['options'].get(question['correct_answer'], '')}"
+        return f"{question.question_text} {question.get_options().get(question.correct_answer, '')}"
+    
+    @staticmethod
+    def shingles(text):
+        """Return the set of character shingles of a fingerprint text"""
+        return minhash.shingles(text)
+    
+    @staticmethod
+    def similarity(shingles_a, shingles_b):
+        """Jaccard similarity of two shingle sets"""
+        return minhash.similarity(shingles_a, shingles_b)
+    
+    @staticmethod
+    def buckets(shingles):
+        """Return the LSH band buckets of a shingle set's MinHash signature"""
+        return minhash.buckets(shingles, settings.QUESTION_DUPLICATE_THRESHOLD)
+    
+    @staticmethod
+    def drop_duplicates(category, questions, accepted=(), buckets=None):
+        """
+        Remove near-duplicates from a batch of generated question dicts
+        
+        Args:
+            category: Category whose stored questions are checked
+            questions (list): Generated question dictionaries
+            accepted (list): Question dicts already kept for the same quiz,
+                which the batch must not repeat either
+            buckets (list): text_buckets of the questions' fingerprint
+                texts, if already computed; computed here otherwise
+        
+        Returns:
+            list: The questions that are neither stored already nor repeated
+        """
+        threshold = settings.QUESTION_DUPLICATE_THRESHOLD
+        shingled = [
+            (question, DuplicateDetectionService.shingles(DuplicateDetectionService.fingerprint_text(question)))
+            for question in questions
+        ]
+        if buckets is None:
+            buckets = [DuplicateDetectionService.buckets(shingles) for _, shingles in shingled]
+        buckets = {id(question): question_buckets for question, question_buckets in zip(questions, buckets)}
+        
+        # One indexed query for every bucket of the batch
+        all_buckets = {bucket for question_buckets in buckets.values() for bucket in question_buckets}
+        candidates = {}
+        for question_id, bucket in QuestionFingerprint.objects.filter(
+            category=category,
+            bucket__in=all_buckets
+        ).values_list('question_id', 'bucket'):
+            candidates.setdefault(bucket, set()).add(question_id)
+        
+        candidate_ids = set().union(*candidates.values()) if candidates else set()
+        stored_shingles = {
+            question.pk: DuplicateDetectionService.shingles(DuplicateDetectionService.fingerprint_text(question))
+            for question in Question.objects.filter(id__in=candidate_ids).only(*FINGERPRINT_FIELDS)
+        }
+        
+        kept_shingles = [
+            DuplicateDetectionService.shingles(DuplicateDetectionService.fingerprint_text(question))
+            for question in accepted
+        ]
+        unique = []
+        for question, shingles in shingled:
+            matches = set()
+            for bucket in buckets[id(question)]:
+                matches |= candidates.get(bucket, set())
+            
+            is_duplicate = any(
+                DuplicateDetectionService.similarity(shingles, stored_shingles.get(question_id, set())) >= threshold
+                for question_id in matches
+            ) or any(
+                DuplicateDetectionService.similarity(shingles, other) >= threshold
+                for other in kept_shingles
+            )
+            
+            if not is_duplicate:
+                unique.append(question)
+                kept_shingles.append(shingles)
+        
+        if len(unique) < len(questions):
+            logger.info(f"Dropped {len(questions) - len(unique)} near-duplicate questions in {category}")
+        return unique
+    
+    @staticmethod
+    def text_buckets(text):
+        """Return the LSH band buckets of a fingerprint text"""
+        return minhash.text_buckets(text, settings.QUESTION_DUPLICATE_THRESHOLD)
+    
+    @staticmethod
+    def index_questions(questions, buckets=None):
+        """
+        Store fingerprints for saved Question objects
+        
+        Args:
+            questions (list): Saved questions
+            buckets (list): Their text_buckets, if already computed (e.g.
+                in worker processes); computed here otherwise
+        """
+        if buckets is None:
+            buckets = [
+                DuplicateDetectionService.text_buckets(DuplicateDetectionService.fingerprint_text(question))
+                for question in questions
+            ]
+        
+        QuestionFingerprint.objects.bulk_create([
+            QuestionFingerprint(question_id=question.pk, category_id=question.category_id, bucket=bucket)
+            for question, question_buckets in zip(questions, buckets)
+            for bucket in question_buckets
+        ])
+
+
+# Singleton instance
+duplicate_detection_service = DuplicateDetectionService()
@@ -0,0 +1,162 @@
+"""
+Explanation service for incorrect answers
+
+Explanations are shared per (question, selected wrong option): there are
+only three wrong options per question, so after warm-up almost every
+request is served from the AnswerExplanation store with no AI call.
+Questions generated with distractor rationales need no warm-up at all.
+"""
+
+from apps.quizzes.models import AnswerExplanation
+from apps.quizzes.services.ai_service import ai_generator
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ExplanationService:
+    """
+    Service class for answer explanations
+    """
+    
+    @staticmethod
+    def get_stored_explanations(answers):
+        """
+        Look up shared explanations for a list of UserAnswer objects
+        
+        Returns:
+            dict: Explanation text by (question_id, selected_answer)
+        """
+        question_ids = {answer.question_id for answer in answers}
+        if not question_ids:
+            return {}
+        
+        return {
+            (row.question_id, row.selected_answer): row.explanation
+            for row in AnswerExplanation.objects.filter(question_id__in=question_ids)
+        }
+    
+    @staticmethod
+    def store_explanations(explanations):
+        """
+        Save explanations keyed by (question_id, selected_answer)
+        
+        Rows another worker stored first are kept as they are.
+        """
+        AnswerExplanation.objects.bulk_create(
+            [
+                AnswerExplanation(question_id=question_id, selected_answer=selected_answer, explanation=text)
+                for (question_id, selected_answer), text in explanations.items()
+            ],
+            ignore_conflicts=True
+        )
+    
+    @staticmethod
+    def get_cached_explanation(answer):
+        """
+        Return an existing explanation for a UserAnswer without calling the AI
+        
+        Returns:
+            str: Explanation text, or None on a store miss
+        """
+        if answer.ai_explanation:
+            return answer.ai_explanation
+        
+        return AnswerExplanation.objects.filter(
+            question_id=answer.question_id,
+            selected_answer=answer.selected_answer
+        ).values_list('explanation', flat=True).first()
+    
+    @staticmethod
+    def get_rationale(answer):
+        """
+        Return the rationale stored with the question for the selected wrong option
+        
+        Rationales are produced together with the question, so serving them
+        needs no AI call at all.
+        """
+        return (answer.question.distractor_rationales or {}).get(answer.selected_answer)
+    
+    @staticmethod
+    def generate_explanation(answer):
+        """
+        Generate and store the shared explanation for a UserAnswer
+        
+        Returns:
+            str: Explanation text
+        """
+        question = answer.question
+        explanation = ai_generator.generate_answer_explanation(
+            question_text=question.question_text,
+            selected_answer=answer.selected_answer,
+            correct_answer=question.correct_answer,
+            options=question.get_options(),
+            dedupe_key=f"{question.id}_{answer.selected_answer}",
+            user_id=answer.attempt.user_id,
+            category=answer.attempt.quiz.category.name
+        )
+        
+        if explanation != ai_generator.EXPLANATION_UNAVAILABLE:
+            ExplanationService.store_explanations({(question.id, answer.selected_answer): explanation})
+        
+        return explanation
+    
+    @staticmethod
+    def explain_attempt(attempt):
+        """
+        Return explanations for every incorrect answer of an attempt
+        
+        Stored AI explanations are preferred, then the question's own
+        distractor rationales; only the remaining misses are generated
+        together in batched completions.
+        
+        Returns:
+            tuple: (explanation text by UserAnswer id, set of UserAnswer ids
+                served from a rationale that can still be explained further)
+        """
+        incorrect_answers = list(
+            attempt.answers.filter(is_correct=False).select_related('question')
+        )
+        stored = ExplanationService.get_stored_explanations(incorrect_answers)
+        
+        explanations = {}
+        from_rationales = set()
+        missing = []
+        for answer in incorrect_answers:
+            text = answer.ai_explanation or stored.get((answer.question_id, answer.selected_answer))
+            rationale = ExplanationService.get_rationale(answer)
+            if text:
+                explanations[answer.id] = text
+            elif rationale:
+                explanations[answer.id] = rationale
+                from_rationales.add(answer.id)
+            else:
+                missing.append(answer)
+        
+        if missing:
+            generated = ai_generator.generate_answer_explanations_batch([
+                {
+                    'key': f"{answer.question_id}_{answer.selected_answer}",
+                    'question_text': answer.question.question_text,
+                    'selected_answer': answer.selected_answer,
+                    'correct_answer': answer.question.correct_answer,
+                    'options': answer.question.get_options(),
+                }
+                for answer in missing
+            ], user_id=attempt.user_id, category=attempt.quiz.category.name)
+            
+            new_explanations = {}
+            for answer in missing:
+                text = generated.get(f"{answer.question_id}_{answer.selected_answer}")
+                if text:
+                    explanations[answer.id] = text
+                    new_explanations[(answer.question_id, answer.selected_answer)] = text
+            
+            ExplanationService.store_explanations(new_explanations)
+            logger.info(f"Stored {len(new_explanations)} shared explanations for attempt {attempt.id}")
+        
+        return explanations, from_rationales
+
+
+# Singleton instance
+explanation_service = ExplanationService()
@@ -0,0 +1,196 @@
+"""
+AI call ledger: one AICallLog row per upstream completion or cache hit
+
+Every row records the endpoint, category, model, token usage, latency,
+outcome and cost of a call. Rows are buffered in memory and written by a
+background thread in bulk, every AI_LEDGER_FLUSH_INTERVAL seconds or once
+AI_LEDGER_BATCH_SIZE rows are waiting, so recording adds no query to the
+request path. A crash loses at most the rows of one interval.
+"""
+
+import atexit
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from apps.quizzes.models import AICallLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AICallLedger:
+    """
+    Buffered writer and aggregate queries for the AI call ledger
+    """
+    
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+    
+    def record(self, endpoint, category='', model='', items=0, response=None, latency=0.0,
+               outcome=AICallLog.OUTCOME_SUCCESS, cache_hit=False):
+        """
+        Buffer one ledger row
+        
+        Args:
+            endpoint (str): AI task, e.g. 'questions' or 'explanation'
+            category (str): Quiz category the call was made for, if known
+            model (str): Model that served the call
+            items (int): Questions or explanations asked for
+            response (LLMResponse): Usage of the call, None for cache hits
+                and failed calls
+            latency (float): Wall time of the call in seconds
+            outcome (str): One of the AICallLog.OUTCOME_* values
+            cache_hit (bool): Served from cache without an upstream call
+        """
+        if not settings.AI_LEDGER_ENABLED:
+            return
+        
+        model = (response.model if response else model) or ''
+        prompt_tokens = response.prompt_tokens if response else 0
+        completion_tokens = response.completion_tokens if response else 0
+        cached_tokens = response.cached_tokens if response else 0
+        entry = AICallLog(
+            created_at=timezone.now(),
+            endpoint=endpoint,
+            category=(category or '')[:100],
+            model=model,
+            items=items,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            latency_ms=int(latency * 1000),
+            outcome=outcome,
+            cache_hit=cache_hit,
+            cost_usd=self.cost(model, prompt_tokens, completion_tokens, cached_tokens),
+        )
+        
+        with self._lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= settings.AI_LEDGER_BATCH_SIZE
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='ai-ledger-writer', daemon=True)
+                self._writer.start()
+        
+        if full:
+            self._wake.set()
+    
+    def flush(self):
+        """
+        Write every buffered row in one bulk insert
+        
+        Returns:
+            int: Number of rows written
+        """
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        if not entries:
+            return 0
+        
+        try:
+            AICallLog.objects.bulk_create(entries)
+        except Exception as e:
+            # The ledger must never break AI calls; drop the batch
+            logger.error(f"Error writing {len(entries)} AI ledger rows: {str(e)}")
+            return 0
+        return len(entries)
+    
+    def _run(self):
+        """Background writer loop"""
+        while True:
+            self._wake.wait(settings.AI_LEDGER_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+    
+    @staticmethod
+    def cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+        """
+        Price a call with AI_MODEL_PRICES, matching dated model names such
+        as 'gpt-3.5-turbo-0125' by their longest configured prefix
+        
+        Returns:
+            Decimal: Cost in USD, 0 for models without a price
+        """
+        prices = settings.AI_MODEL_PRICES
+        matches = [name for name in prices if (model or '').startswith(name)]
+        if not matches:
+            return Decimal(0)
+        
+        prompt_price, completion_price = prices[max(matches, key=len)]
+        billed_prompt = prompt_tokens - cached_tokens * settings.AI_CACHED_PROMPT_DISCOUNT
+        cost = (billed_prompt * prompt_price + completion_tokens * completion_price) / 1000
+        return Decimal(str(round(cost, 6)))
+    
+    @staticmethod
+    def summary(days=7, group_by=('day', 'endpoint')):
+        """
+        Aggregate the ledger of the last days
+        
+        Args:
+            days (int): Number of days to include, today included
+            group_by (tuple): Any of 'day', 'category', 'endpoint', 'model'
+        
+        Returns:
+            QuerySet: One dict per group with calls, cache_hits, errors,
+                total_items, total_prompt_tokens, total_completion_tokens,
+                total_cached_tokens, avg_latency_ms and total_cost
+        """
+        since = timezone.now() - timedelta(days=days)
+        fields = list(group_by)
+        
+        return (
+            AICallLog.objects.filter(created_at__gte=since)
+            .annotate(day=TruncDate('created_at'))
+            .values(*fields)
+            .annotate(
+                calls=Count('id'),
+                cache_hits=Count('id', filter=Q(cache_hit=True)),
+                errors=Count('id', filter=~Q(outcome=AICallLog.OUTCOME_SUCCESS)),
+                total_items=Sum('items'),
+                total_prompt_tokens=Sum('prompt_tokens'),
+                total_completion_tokens=Sum('completion_tokens'),
+                total_cached_tokens=Sum('cached_tokens'),
+                avg_latency_ms=Avg('latency_ms', filter=Q(cache_hit=False)),
+                total_cost=Sum('cost_usd'),
+            )
+            .order_by(*fields)
+        )
+    
+    @staticmethod
+    def tokens_per_item(endpoint, days=7):
+        """
+        Average prompt plus completion tokens per question or explanation
+        of successful upstream calls
+        
+        Returns:
+            float: Tokens per item, or None without ledger data
+        """
+        totals = AICallLog.objects.filter(
+            endpoint=endpoint,
+            created_at__gte=timezone.now() - timedelta(days=days),
+            outcome=AICallLog.OUTCOME_SUCCESS,
+            cache_hit=False,
+        ).aggregate(
+            total_items=Sum('items'),
+            total_tokens=Sum('prompt_tokens') + Sum('completion_tokens'),
+        )
+        if not totals['total_items']:
+            return None
+        return totals['total_tokens'] / totals['total_items']
+
+
+# Singleton instance
+ai_call_ledger = AICallLedger()
+
+# Write what is still buffered when the process exits
+atexit.register(ai_call_ledger.flush)
@@ -0,0 +1,362 @@
+"""
+LLM provider backends for the AI service
+
+AIQuestionGenerator talks to a provider instead of a concrete SDK client.
+AI_PROVIDER selects the backend:
+
+- 'openai': the OpenAI chat completions API
+- 'stub': a local, seedable backend returning valid question sets and
+  explanations with configurable latency and error rate, for load tests,
+  benchmarks and CI without network access or a billed key
+"""
+
+import json
+import math
+import os
+import random
+import threading
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponse:
+    """
+    Provider-independent result of a completion
+    """
+    
+    def __init__(self, text, model, prompt_tokens=0, completion_tokens=0, finish_reason='stop', cached_tokens=0):
+        self.text = text
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.finish_reason = finish_reason
+        # Prompt tokens served from the provider's prompt cache
+        self.cached_tokens = cached_tokens
+
+
+class BaseLLMProvider:
+    """
+    Interface every provider backend implements
+    
+    The keyword hints passed with each call (task, num_questions, topic,
+    difficulty, items) describe what the prompt asks for. Real backends
+    ignore them; the stub uses them to produce a well-formed answer.
+    
+    model selects the model of a single call; it defaults to self.model.
+    timeout caps the time a single completion may take, in seconds; for a
+    stream it caps the wait for each delta.
+    """
+    
+    name = 'base'
+    
+    # Exceptions that signal a transient upstream problem (worth a retry and
+    # counted by the circuit breaker)
+    retryable_errors = ()
+    
+    def __init__(self):
+        self.model = settings.OPENAI_MODEL
+    
+    def is_configured(self):
+        """Return True if the backend can serve requests"""
+        return True
+    
+    def complete(self, messages, max_tokens, temperature, model=None, timeout=None, **hints):
+        """
+        Run a chat completion
+        
+        Returns:
+            LLMResponse
+        """
+        raise NotImplementedError
+    
+    def stream(self, messages, max_tokens, temperature, model=None, timeout=None, **hints):
+        """
+        Run a chat completion, yielding text deltas as they arrive
+        
+        Returns:
+            LLMResponse: Usage of the call (with empty text) when the
+                backend reports it, otherwise None
+        """
+        raise NotImplementedError
+
+
+class OpenAIProvider(BaseLLMProvider):
+    """
+    OpenAI chat completions backend
+    """
+    
+    name = 'openai'
+    
+    def __init__(self):
+        super().__init__()
+        self._client = None
+    
+    @property
+    def client(self):
+        """Lazy load OpenAI client to avoid import-time initialization issues"""
+        if self._client is None:
+            import httpx
+            from openai import OpenAI
+            # Hard timeouts and no SDK retries: the AI service retries and
+            # cuts each attempt's timeout to what is left of its deadline
+            self._client = OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                timeout=httpx.Timeout(settings.AI_READ_TIMEOUT, connect=settings.AI_CONNECT_TIMEOUT),
+                max_retries=0,
+            )
+        return self._client
+    
+    @property
+    def retryable_errors(self):
+        import openai
+        return (
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        )
+    
+    def is_configured(self):
+        return bool(settings.OPENAI_API_KEY)
+    
+    def complete(self, messages, max_tokens, temperature, model=None, timeout=None, **hints):
+        response = self._client_for(timeout).chat.completions.create(
+            model=model or self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        return self._response(
+            response.choices[0].message.content or '',
+            response.model,
+            response.usage,
+            response.choices[0].finish_reason,
+        )
+    
+    def stream(self, messages, max_tokens, temperature, model=None, timeout=None, **hints):
+        # httpx applies the read timeout to every chunk of the stream
+        stream = self._client_for(timeout).chat.completions.create(
+            model=model or self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={'include_usage': True},
+        )
+        usage = None
+        finish_reason = 'stop'
+        for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        
+        return self._response('', model or self.model, usage, finish_reason) if usage else None
+    
+    def _client_for(self, timeout):
+        """Return the client, with its timeouts cut to timeout if given"""
+        if timeout is None:
+            return self.client
+        import httpx
+        return self.client.with_options(timeout=httpx.Timeout(timeout, connect=min(timeout, settings.AI_CONNECT_TIMEOUT)))
+    
+    def _response(self, text, model, usage, finish_reason):
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return LLMResponse(
+            text=text,
+            model=model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            finish_reason=finish_reason,
+            cached_tokens=(getattr(details, 'cached_tokens', 0) or 0) if details else 0,
+        )
+
+
+# Words the stub builds question texts from; random combinations keep stub
+# questions apart for the near-duplicate detector
+STUB_WORDS = (
+    'alpha beacon cascade delta ember falcon glacier harbor iris juniper kernel lattice meadow '
+    'nebula orbit prism quartz river summit tundra umbra vertex willow xenon yonder zephyr anchor '
+    'bramble cobalt dune echo fjord granite horizon ivory jasper kelp lagoon mosaic nectar'
+).split()
+
+
+class StubProviderError(Exception):
+    """Simulated upstream failure raised by the stub backend"""
+
+
+class StubProvider(BaseLLMProvider):
+    """
+    Seedable local backend for load tests and CI
+    
+    Latency follows a log-normal distribution around AI_STUB_LATENCY_MEDIAN
+    with shape AI_STUB_LATENCY_SIGMA, plus the output length over
+    AI_STUB_TOKENS_PER_SECOND when set, and AI_STUB_ERROR_RATE of calls fail.
+    A call, or a stream delta, slower than its timeout fails once the
+    timeout has passed.
+    Output is drawn from a generator seeded with AI_STUB_SEED, mixed with
+    the process id and start time so workers and reruns produce different
+    questions (the near-duplicate filter would drop repeats). With
+    AI_STUB_DETERMINISTIC the seed is used alone, and a run with the same
+    call sequence produces the same questions.
+    """
+    
+    name = 'stub'
+    retryable_errors = (StubProviderError,)
+    
+    def __init__(self):
+        super().__init__()
+        self.model = 'stub'
+        seed = settings.AI_STUB_SEED
+        if not settings.AI_STUB_DETERMINISTIC:
+            seed = f"{seed}:{os.getpid()}:{time.time_ns()}"
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cached_prefixes = set()
+    
+    def complete(self, messages, max_tokens, temperature, model=None, timeout=None, **hints):
+        with self._lock:
+            latency, fails, text = self._draw(messages, hints)
+        
+        if timeout is not None and latency > timeout:
+            time.sleep(max(timeout, 0))
+            raise StubProviderError('Simulated timeout')
+        
+        time.sleep(latency)
+        if fails:
+            raise StubProviderError('Simulated upstream error')
+        
+        return self._response(messages, text, model=model)
+    
+    def stream(self, messages, max_tokens, temperature, model=None, timeout=None, **hints):
+        with self._lock:
+            latency, fails, text = self._draw(messages, hints)
+        
+        # Spread the latency across the output like a real token stream
+        pieces = [text[i:i + 40] for i in range(0, len(text), 40)] or ['']
+        for piece in pieces:
+            if timeout is not None and latency / len(pieces) > timeout:
+                time.sleep(max(timeout, 0))
+                raise StubProviderError('Simulated timeout')
+            time.sleep(latency / len(pieces))
+            if fails:
+                raise StubProviderError('Simulated upstream error')
+            yield piece
+        
+        return self._response(messages, '', self._count_tokens(text), model=model)
+    
+    def _response(self, messages, text, completion_tokens=None, model=None):
+        """
+        Build the usage of a call, simulating a provider prompt cache that
+        serves a repeated system message
+        """
+        prefix = messages[0]['content']
+        with self._lock:
+            cached = prefix in self._cached_prefixes
+            self._cached_prefixes.add(prefix)
+        
+        return LLMResponse(
+            text=text,
+            model=model or self.model,
+            prompt_tokens=self._count_tokens(''.join(m['content'] for m in messages)),
+            completion_tokens=self._count_tokens(text) if completion_tokens is None else completion_tokens,
+            cached_tokens=self._count_tokens(prefix) if cached else 0,
+        )
+    
+    def _draw(self, messages, hints):
+        """Draw latency, failure and response text from the seeded generator"""
+        latency = self._random.lognormvariate(
+            math.log(settings.AI_STUB_LATENCY_MEDIAN), settings.AI_STUB_LATENCY_SIGMA
+        )
+        fails = self._random.random() < settings.AI_STUB_ERROR_RATE
+        
+        task = hints.get('task')
+        if task == 'questions' and hints.get('response_format') == 'compact':
+            text = '\n'.join(
+                json.dumps([
+                    q['question'], *q['options'].values(), q['correct_answer'], q['explanation'],
+                    list(q['rationales'].values()), *([q['difficulty']] if 'difficulty' in q else [])
+                ])
+                for q in self._questions(hints)
+            )
+        elif task == 'questions':
+            text = json.dumps(self._questions(hints), indent=4)
+        elif task == 'explanation_batch':
+            text = json.dumps({
+                str(number): self._explanation(item)
+                for number, item in enumerate(hints.get('items', []), start=1)
+            })
+        else:
+            text = self._explanation(hints)
+        
+        # Output tokens dominate real completion latency
+        if settings.AI_STUB_TOKENS_PER_SECOND:
+            latency += self._count_tokens(text) / settings.AI_STUB_TOKENS_PER_SECOND
+        
+        return latency, fails, text
+    
+    def _questions(self, hints):
+        # Multi-level requests tag each question with its difficulty
+        if hints.get('variants'):
+            questions = []
+            for difficulty, count in hints['variants'].items():
+                for question in self._questions({**hints, 'variants': None, 'difficulty': difficulty, 'num_questions': count}):
+                    question['difficulty'] = difficulty
+                    questions.append(question)
+            return questions
+        
+        topic = hints.get('topic') or 'General Knowledge'
+        difficulty = hints.get('difficulty') or 'medium'
+        questions = []
+        
+        for _ in range(hints.get('num_questions', 10)):
+            token = self._random.getrandbits(32)
+            correct = self._random.choice('ABCD')
+            words = self._random.sample(STUB_WORDS, 6)
+            questions.append({
+                'question': "Which {} {} fact holds for {} {} and {} {}?".format(*words),
+                'options': {key: f"Statement {key} about item {token:08x}" for key in 'ABCD'},
+                'correct_answer': correct,
+                'explanation': f"Statement {correct} is the true one for item {token:08x} ({topic}, {difficulty}).",
+                'rationales': {
+                    key: f"Statement {key} is false for item {token:08x}."
+                    for key in 'ABCD' if key != correct
+                },
+            })
+        
+        return questions
+    
+    def _explanation(self, hints):
+        return (
+            f"The correct answer is {hints.get('correct_answer', 'the marked option')} "
+            f"rather than {hints.get('selected_answer', 'the one you chose')}. "
+            "Review the explanation above to see why."
+        )
+    
+    def _count_tokens(self, text):
+        """Rough token count (about four characters per token)"""
+        return max(1, len(text) // 4)
+
+
+PROVIDERS = {
+    'openai': 'apps.quizzes.services.llm_providers.OpenAIProvider',
+    'stub': 'apps.quizzes.services.llm_providers.StubProvider',
+}
+
+
+def get_provider(name=None):
+    """
+    Build the provider selected by AI_PROVIDER
+    
+    Args:
+        name (str): Provider name or dotted path to a BaseLLMProvider
+            subclass; defaults to settings.AI_PROVIDER
+    """
+    name = name or settings.AI_PROVIDER
+    return import_string(PROVIDERS.get(name, name))()
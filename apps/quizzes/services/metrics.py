@@ -0,0 +1,82 @@
+"""
+Lightweight timing and counter metrics kept in the shared cache
+
+Counters are bucketed per day so every gunicorn worker contributes to the
+same numbers without a separate metrics backend.
+"""
+
+from django.core.cache import cache
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+METRICS_TIMEOUT = 60 * 60 * 24 * 8  # keep a week of daily buckets
+
+
+def _metric_key(name, day=None):
+    day = day or timezone.now().date()
+    return f"metrics_{name}_{day.isoformat()}"
+
+
+def record_timing(name, seconds):
+    """
+    Record one timing sample in milliseconds
+    
+    Args:
+        name (str): Metric name, e.g. 'ai_time_to_first_question'
+        seconds (float): Measured duration
+    """
+    key = _metric_key(name)
+    elapsed_ms = int(seconds * 1000)
+    
+    try:
+        cache.add(f"{key}_count", 0, METRICS_TIMEOUT)
+        cache.add(f"{key}_total_ms", 0, METRICS_TIMEOUT)
+        cache.incr(f"{key}_count")
+        cache.incr(f"{key}_total_ms", elapsed_ms)
+        
+        if elapsed_ms > (cache.get(f"{key}_max_ms") or 0):
+            cache.set(f"{key}_max_ms", elapsed_ms, METRICS_TIMEOUT)
+    except ValueError:
+        # Bucket expired between add() and incr()
+        pass
+    
+    logger.info(f"{name}: {elapsed_ms}ms")
+
+
+def record_count(name, amount=1):
+    """
+    Add amount to a daily counter, e.g. 'ai_cached_prompt_tokens'
+    """
+    key = f"{_metric_key(name)}_total"
+    
+    try:
+        cache.add(key, 0, METRICS_TIMEOUT)
+        cache.incr(key, amount)
+    except ValueError:
+        # Bucket expired between add() and incr()
+        pass
+
+
+def get_count(name, day=None):
+    """Return the total of a daily counter"""
+    return cache.get(f"{_metric_key(name, day)}_total") or 0
+
+
+def get_timing(name, day=None):
+    """
+    Return aggregated samples for a metric on a given day
+    
+    Returns:
+        dict: count, avg_ms and max_ms
+    """
+    key = _metric_key(name, day)
+    count = cache.get(f"{key}_count") or 0
+    total_ms = cache.get(f"{key}_total_ms") or 0
+    
+    return {
+        'count': count,
+        'avg_ms': round(total_ms / count) if count else 0,
+        'max_ms': cache.get(f"{key}_max_ms") or 0,
+    }
@@ -0,0 +1,94 @@
+"""
+MinHash/LSH fingerprints of question texts
+
+Pure functions without Django imports, so import_questions can compute
+fingerprints in worker processes under any multiprocessing start method
+(spawned workers import this module without django.setup()).
+"""
+
+import functools
+import hashlib
+import random
+import re
+
+# Changing these, or the duplicate threshold, invalidates stored fingerprints
+# (re-run index_questions --rebuild)
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 5
+# How far below the duplicate threshold the LSH S-curve is centred, so pairs
+# right at the threshold are still likely to share a band
+RECALL_MARGIN = 0.05
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x51AB)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+@functools.lru_cache(maxsize=None)
+def band_shape(threshold):
+    """
+    Return (bands, rows) for a Jaccard duplicate threshold
+    
+    A pair with similarity s shares a band with probability
+    1 - (1 - s**rows)**bands, which rises steeply around (1/bands)**(1/rows).
+    The shape puts that point just below the threshold, so candidates are
+    mostly real duplicates and few pairs at the threshold are missed.
+    """
+    target = threshold - RECALL_MARGIN
+    return min(
+        ((NUM_PERMUTATIONS // rows, rows) for rows in range(1, NUM_PERMUTATIONS + 1)),
+        key=lambda shape: abs((1 / shape[0]) ** (1 / shape[1]) - target)
+    )
+
+
+def shingles(text):
+    """
+    Return the set of character shingles of a fingerprint text
+    
+    Case, punctuation and spacing are ignored, so rewordings that only
+    differ in those still match.
+    """
+    normalized = ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+    return {
+        normalized[i:i + SHINGLE_SIZE]
+        for i in range(max(1, len(normalized) - SHINGLE_SIZE + 1))
+    }
+
+
+def similarity(shingles_a, shingles_b):
+    """Jaccard similarity of two shingle sets"""
+    if not shingles_a or not shingles_b:
+        return 0.0
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+
+def buckets(shingle_set, threshold):
+    """
+    Return the LSH band buckets of a shingle set's MinHash signature
+    
+    The band shape is derived from the duplicate threshold (see band_shape).
+    """
+    num_bands, rows_per_band = band_shape(threshold)
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big')
+        for shingle in shingle_set
+    ]
+    signature = [
+        min((a * h + b) % _PRIME for h in hashes)
+        for a, b in _PERMUTATIONS[:num_bands * rows_per_band]
+    ]
+    
+    band_buckets = []
+    for band in range(num_bands):
+        rows = signature[band * rows_per_band:(band + 1) * rows_per_band]
+        digest = hashlib.blake2b(f"{rows_per_band}:{band}:{rows}".encode(), digest_size=8).digest()
+        band_buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return band_buckets
+
+
+def text_buckets(text, threshold):
+    """Return the LSH band buckets of a fingerprint text"""
+    return buckets(shingles(text), threshold)
@@ -0,0 +1,134 @@
+"""
+Latency-based model routing and hedging for AI calls
+
+Every completed call adds its latency to a histogram kept in the shared
+cache per model and task, over the current and previous
+AI_LATENCY_WINDOW. The router uses the histograms to decide:
+
+- when to hedge: a call still running at the AI_HEDGE_PERCENTILE latency
+  of its model gets a duplicate request
+- where to send the hedge: the model of the task with the lowest median
+  latency; models without enough samples yet are tried first so they get
+  measured
+
+Question generation and explanations have their own model lists
+(AI_QUESTION_MODELS, AI_EXPLANATION_MODELS), so explanations can run on a
+smaller, faster model. The first model of a list takes every primary call.
+"""
+
+import time
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets in seconds; the last one is open
+LATENCY_BUCKETS = (0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 6, 8, 12, 16, 24, 32, float('inf'))
+
+
+class ModelRouter:
+    """
+    Service class choosing models and hedge deadlines from observed latency
+    """
+    
+    @staticmethod
+    def models(task):
+        """Return the configured models of a task, preferred model first"""
+        if task and task.startswith('explanation'):
+            return settings.AI_EXPLANATION_MODELS
+        return settings.AI_QUESTION_MODELS
+    
+    @staticmethod
+    def route(task):
+        """
+        Choose the models and hedge deadline of a call
+        
+        Returns:
+            tuple: (primary model, hedge model or None when hedging is
+                off, seconds to wait before hedging)
+        """
+        models = ModelRouter.models(task)
+        primary = models[0]
+        
+        hedge_delay = ModelRouter.percentile(primary, task, settings.AI_HEDGE_PERCENTILE)
+        if hedge_delay is None:
+            hedge_delay = settings.AI_HEDGE_DEFAULT_DELAY
+        hedge_delay = max(hedge_delay, settings.AI_HEDGE_MIN_DELAY)
+        
+        if not settings.AI_HEDGE_ENABLED:
+            return primary, None, hedge_delay
+        
+        # Unmeasured models sort first (-1) so each gets samples
+        medians = [(ModelRouter.percentile(model, task, 0.5), model) for model in models]
+        _, hedge_model = min(
+            medians,
+            key=lambda item: -1 if item[0] is None else item[0]
+        )
+        return primary, hedge_model, hedge_delay
+    
+    @staticmethod
+    def record(model, task, seconds):
+        """
+        Add one call latency to the histogram of a model and task
+        """
+        bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound)
+        key = f"{ModelRouter._key(model, task, ModelRouter._window())}_{bucket}"
+        
+        try:
+            cache.add(key, 0, settings.AI_LATENCY_WINDOW * 2)
+            cache.incr(key)
+        except ValueError:
+            # Window expired between add() and incr()
+            pass
+    
+    @staticmethod
+    def percentile(model, task, q):
+        """
+        Return the q-th latency quantile (0.0 - 1.0) of a model and task
+        
+        The answer is the upper bound of the histogram bucket the quantile
+        falls in, so it errs on the slow side.
+        
+        Returns:
+            float: Seconds, or None below AI_HEDGE_MIN_SAMPLES samples
+        """
+        counts = ModelRouter.histogram(model, task)
+        total = sum(counts)
+        if total < settings.AI_HEDGE_MIN_SAMPLES:
+            return None
+        
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, counts):
+            seen += count
+            if seen >= q * total:
+                # The open bucket has no bound; report the last finite one
+                return bound if bound != float('inf') else LATENCY_BUCKETS[-2]
+        return LATENCY_BUCKETS[-2]
+    
+    @staticmethod
+    def histogram(model, task):
+        """Return the bucket counts of the current and previous window"""
+        window = ModelRouter._window()
+        keys = [
+            f"{ModelRouter._key(model, task, w)}_{bucket}"
+            for w in (window - 1, window)
+            for bucket in range(len(LATENCY_BUCKETS))
+        ]
+        values = cache.get_many(keys)
+        return [
+            sum(values.get(f"{ModelRouter._key(model, task, w)}_{bucket}", 0) for w in (window - 1, window))
+            for bucket in range(len(LATENCY_BUCKETS))
+        ]
+    
+    @staticmethod
+    def _window():
+        return int(time.time() // settings.AI_LATENCY_WINDOW)
+    
+    @staticmethod
+    def _key(model, task, window):
+        return f"ai_latency_{task}_{model}_{window}"
+
+
+# Singleton instance
+ai_model_router = ModelRouter()
@@ -0,0 +1,413 @@
+"""
+Question pool service for the reusable question bank
+
+Every (category, subcategory, difficulty) cell keeps a bank of questions.
+Starting a quiz samples questions from the bank at random and links them to
+the quiz, so the same question can serve many quizzes. A background refill
+generates new questions only while the cell is below the low-water mark, so
+the AI call stays off the request path once the bank is built up.
+"""
+
+import math
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from apps.quizzes.models import Quiz, Question, Category
+from apps.quizzes.services.ai_service import ai_generator
+from apps.quizzes.services.rate_limiter import PRIORITY_BACKGROUND
+from apps.quizzes.services.duplicate_service import duplicate_detection_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionPoolService:
+    """
+    Service class for question pool operations
+    """
+    
+    @staticmethod
+    def cell_key(category, subcategory, difficulty):
+        """Return the cache key suffix of a pool cell"""
+        return f"{category.pk}_{subcategory.pk if subcategory else 0}_{difficulty}"
+    
+    @staticmethod
+    def pooled_questions(category, subcategory, difficulty):
+        """
+        Return the bank questions of a pool cell
+        """
+        return Question.objects.filter(
+            category=category,
+            subcategory=subcategory,
+            difficulty=difficulty,
+        )
+    
+    @staticmethod
+    def pooled_count(category, subcategory, difficulty):
+        """Return number of bank questions in a pool cell"""
+        return QuestionPoolService.pooled_questions(category, subcategory, difficulty).count()
+    
+    @staticmethod
+    def sample_questions(category, subcategory, difficulty, num_questions, exclude_ids=(), seen=None):
+        """
+        Pick random bank questions of a pool cell
+        
+        See sample_from.
+        """
+        return QuestionPoolService.sample_from(
+            QuestionPoolService.pooled_questions(category, subcategory, difficulty),
+            num_questions,
+            exclude_ids,
+            seen,
+        )
+    
+    @staticmethod
+    def sample_from(questions, num_questions, exclude_ids=(), seen=None):
+        """
+        Pick up to num_questions random questions of a queryset
+        
+        Instead of ORDER BY RANDOM(), which sorts the whole cell, each of
+        up to QUIZ_SAMPLE_PROBES probes draws a random point in [0, 1) and
+        reads the next questions by random_key, wrapping around at 1. With
+        the (category, subcategory, difficulty, random_key) index every
+        probe is a short range scan, whatever the size of the bank.
+        
+        With a seen filter (see seen_service) probes read
+        QUIZ_SEEN_OVERSAMPLE times as many questions and unseen ones are
+        picked first; seen questions only fill the slots that are left.
+        
+        Returns:
+            list: Distinct questions in random order, unseen first, fewer
+                than num_questions if the queryset runs short
+        """
+        if num_questions <= 0:
+            return []
+        
+        picked = {}
+        already_seen = {}
+        excluded = set(exclude_ids)
+        probes = min(num_questions, settings.QUIZ_SAMPLE_PROBES)
+        per_probe = math.ceil(num_questions / probes)
+        oversample = settings.QUIZ_SEEN_OVERSAMPLE if seen is not None else 1
+        
+        # A last probe fills slots lost to probes that overlapped
+        for probe in range(probes + 1):
+            wanted = num_questions - len(picked)
+            if probe < probes:
+                wanted = min(wanted, per_probe)
+            if wanted <= 0:
+                continue
+            
+            limit = wanted * oversample
+            candidates = questions.exclude(id__in=excluded | picked.keys() | already_seen.keys())
+            start = random.random()
+            found = list(candidates.filter(random_key__gte=start).order_by('random_key')[:limit])
+            if len(found) < limit:
+                found += list(candidates.filter(random_key__lt=start).order_by('random_key')[:limit - len(found)])
+            if not found and probe < probes:
+                break
+            
+            for question in found:
+                if seen is not None and question.id in seen:
+                    already_seen[question.id] = question
+                elif len(picked) < num_questions:
+                    picked[question.id] = question
+        
+        sample = list(picked.values())
+        random.shuffle(sample)
+        
+        fill = list(already_seen.values())
+        random.shuffle(fill)
+        return sample + fill[:num_questions - len(sample)]
+    
+    @staticmethod
+    def refill(category, subcategory, difficulty):
+        """
+        Generate questions until the pool cell reaches its target size
+        
+        Returns:
+            int: Number of questions added to the pool
+        """
+        return QuestionPoolService.refill_cells(category, subcategory, [difficulty])[difficulty]
+    
+    @staticmethod
+    def refill_cells(category, subcategory, difficulties):
+        """
+        Generate questions until the pool cells of several difficulty levels
+        of one subcategory reach their target size
+        
+        The levels share their AI calls (see generate_variant_batch).
+        
+        Returns:
+            dict: Number of questions added by difficulty
+        """
+        target = settings.QUIZ_POOL_TARGET
+        batch_size = settings.QUIZ_MAX_QUESTIONS
+        added = dict.fromkeys(difficulties, 0)
+        
+        for _ in range(settings.QUIZ_POOL_MAX_BATCHES_PER_REFILL):
+            counts = {}
+            for difficulty in difficulties:
+                missing = target - QuestionPoolService.pooled_count(category, subcategory, difficulty)
+                if missing > 0:
+                    counts[difficulty] = min(missing, batch_size)
+            if not counts:
+                break
+            
+            for difficulty, count in QuestionPoolService.generate_variant_batch(category, subcategory, counts).items():
+                added[difficulty] += count
+        
+        for difficulty in difficulties:
+            logger.info(f"Refilled pool {category.name}/{subcategory}/{difficulty} with {added[difficulty]} questions")
+        return added
+    
+    @staticmethod
+    def generate_batch(category, subcategory, difficulty, num_questions):
+        """
+        Generate one batch of questions into a pool cell
+        
+        Near-duplicates of stored questions are dropped, so the batch can
+        add fewer than num_questions; later batches ask for the slots again.
+        
+        Returns:
+            int: Number of questions added to the pool
+        """
+        ai_questions = ai_generator.generate_questions(
+            category=category.name,
+            subcategory=subcategory.name if subcategory else None,
+            difficulty=difficulty,
+            num_questions=num_questions,
+            priority=PRIORITY_BACKGROUND,
+        )
+        ai_questions = duplicate_detection_service.drop_duplicates(category, ai_questions)
+        
+        questions = Question.objects.bulk_create([
+            Question.from_generated(
+                q_data,
+                category=category,
+                subcategory=subcategory,
+                difficulty=difficulty,
+            )
+            for q_data in ai_questions
+        ])
+        duplicate_detection_service.index_questions(questions)
+        return len(questions)
+    
+    @staticmethod
+    def generate_variant_batch(category, subcategory, counts):
+        """
+        Generate one batch of questions into the pool cells of several
+        difficulty levels of one subcategory
+        
+        All levels are asked for in shared AI calls, so warming the easy,
+        medium and hard cells of a subcategory costs one round of calls
+        instead of three.
+        
+        Args:
+            counts (dict): Number of questions by difficulty level
+        
+        Returns:
+            dict: Number of questions added by difficulty
+        """
+        if len(counts) == 1:
+            (difficulty, num_questions), = counts.items()
+            return {difficulty: QuestionPoolService.generate_batch(category, subcategory, difficulty, num_questions)}
+        
+        generated = ai_generator.generate_question_variants(
+            category=category.name,
+            subcategory=subcategory.name if subcategory else None,
+            counts=counts,
+            priority=PRIORITY_BACKGROUND,
+        )
+        difficulties = {id(q_data): difficulty for difficulty, batch in generated.items() for q_data in batch}
+        ai_questions = duplicate_detection_service.drop_duplicates(
+            category, [q_data for batch in generated.values() for q_data in batch]
+        )
+        
+        questions = Question.objects.bulk_create([
+            Question.from_generated(
+                q_data,
+                category=category,
+                subcategory=subcategory,
+                difficulty=difficulties[id(q_data)],
+            )
+            for q_data in ai_questions
+        ])
+        duplicate_detection_service.index_questions(questions)
+        
+        added = dict.fromkeys(counts, 0)
+        for question in questions:
+            added[question.difficulty] += 1
+        return added
+    
+    @staticmethod
+    def refill_if_low(category, subcategory, difficulty):
+        """
+        Refill a pool cell if it is below the low-water mark
+        """
+        return QuestionPoolService.refill_cells_if_low(category, subcategory, [difficulty]).get(difficulty, 0)
+    
+    @staticmethod
+    def refill_cells_if_low(category, subcategory, difficulties):
+        """
+        Refill the pool cells of a subcategory that are below the low-water
+        mark, sharing AI calls between their difficulty levels
+        
+        A cache lock per cell keeps concurrent workers from refilling the
+        same cell; cells locked by another worker are skipped.
+        
+        Returns:
+            dict: Number of questions added by difficulty
+        """
+        lock_keys = {}
+        for difficulty in difficulties:
+            cell = QuestionPoolService.cell_key(category, subcategory, difficulty)
+            if QuestionPoolService.pooled_count(category, subcategory, difficulty) >= settings.QUIZ_POOL_LOW_WATER:
+                cache.set(f"quiz_pool_healthy_{cell}", True, settings.QUIZ_POOL_HEALTHY_TIMEOUT)
+                continue
+            lock_key = f"quiz_pool_refill_{cell}"
+            if cache.add(lock_key, True, settings.QUIZ_POOL_REFILL_LOCK_TIMEOUT):
+                lock_keys[difficulty] = lock_key
+        
+        if not lock_keys:
+            return {}
+        
+        try:
+            return QuestionPoolService.refill_cells(category, subcategory, list(lock_keys))
+        except Exception as e:
+            logger.error(f"Error refilling question pool: {str(e)}")
+            return {}
+        finally:
+            cache.delete_many(list(lock_keys.values()))
+    
+    @staticmethod
+    def acquire_fill(category, subcategory, difficulty):
+        """
+        Try to become the one request that generates into a short pool cell
+        
+        Takes the cell's refill lock, so a quiz filling the cell inline and
+        a refill of the same cell never run at once.
+        
+        Returns:
+            bool: True if the caller now holds the lock; it must call
+                release_fill when its generation is done
+        """
+        cell = QuestionPoolService.cell_key(category, subcategory, difficulty)
+        return cache.add(f"quiz_pool_refill_{cell}", True, settings.QUIZ_POOL_REFILL_LOCK_TIMEOUT)
+    
+    @staticmethod
+    def release_fill(category, subcategory, difficulty):
+        """Release a pool cell's refill lock taken with acquire_fill"""
+        cell = QuestionPoolService.cell_key(category, subcategory, difficulty)
+        cache.delete(f"quiz_pool_refill_{cell}")
+    
+    @staticmethod
+    def wait_for_fill(category, subcategory, difficulty, num_questions):
+        """
+        Wait while another request or a refill generates into a pool cell
+        
+        Returns as soon as the cell holds num_questions questions or its
+        refill lock is released, or after QUIZ_POOL_FILL_WAIT_TIMEOUT.
+        
+        Returns:
+            bool: False if the wait timed out with the cell still locked
+                and short
+        """
+        cell = QuestionPoolService.cell_key(category, subcategory, difficulty)
+        deadline = time.monotonic() + settings.QUIZ_POOL_FILL_WAIT_TIMEOUT
+        
+        while cache.get(f"quiz_pool_refill_{cell}"):
+            if QuestionPoolService.pooled_count(category, subcategory, difficulty) >= num_questions:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(settings.QUIZ_POOL_FILL_POLL_INTERVAL)
+        return True
+    
+    @staticmethod
+    def schedule_refill(category, subcategory, difficulty):
+        """
+        Refill a pool cell in a background thread if it is running low
+        
+        Disabled with QUIZ_POOL_BACKGROUND_REFILL when the dedicated
+        refill_question_pool worker is deployed.
+        
+        Called on every quiz start, so it does no work on the request path
+        for a cell that was recently found at its low-water mark, and starts
+        a thread only when it gets the cell's refill lock.
+        """
+        if not settings.QUIZ_POOL_BACKGROUND_REFILL:
+            return
+        
+        cell = QuestionPoolService.cell_key(category, subcategory, difficulty)
+        if cache.get(f"quiz_pool_healthy_{cell}"):
+            return
+        
+        lock_key = f"quiz_pool_refill_{cell}"
+        if not cache.add(lock_key, True, settings.QUIZ_POOL_REFILL_LOCK_TIMEOUT):
+            return
+        
+        def run():
+            try:
+                if QuestionPoolService.pooled_count(category, subcategory, difficulty) < settings.QUIZ_POOL_LOW_WATER:
+                    QuestionPoolService.refill_cells(category, subcategory, [difficulty])
+                if QuestionPoolService.pooled_count(category, subcategory, difficulty) >= settings.QUIZ_POOL_LOW_WATER:
+                    cache.set(f"quiz_pool_healthy_{cell}", True, settings.QUIZ_POOL_HEALTHY_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error refilling question pool: {str(e)}")
+            finally:
+                cache.delete(lock_key)
+                connection.close()
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    @staticmethod
+    def iter_cells(category_slug=None):
+        """
+        Yield every active (category, subcategory, difficulty) cell
+        
+        Category-level quizzes without a subcategory are a cell of their own.
+        """
+        categories = Category.objects.filter(is_active=True).prefetch_related('subcategories')
+        if category_slug:
+            categories = categories.filter(slug=category_slug)
+        
+        for category in categories:
+            subcategories = [None] + [s for s in category.subcategories.all() if s.is_active]
+            for subcategory in subcategories:
+                for difficulty, _ in Quiz.DIFFICULTY_CHOICES:
+                    yield category, subcategory, difficulty
+    
+    @staticmethod
+    def cell_counts():
+        """
+        Return bank question counts by (category_id, subcategory_id, difficulty)
+        """
+        return {
+            (row['category'], row['subcategory'], row['difficulty']): row['total']
+            for row in Question.objects
+            .values('category', 'subcategory', 'difficulty')
+            .annotate(total=Count('id'))
+        }
+    
+    @staticmethod
+    def low_cells(category_slug=None):
+        """
+        Return the cells whose bank is below the low-water mark
+        """
+        counts = QuestionPoolService.cell_counts()
+        
+        return [
+            (category, subcategory, difficulty)
+            for category, subcategory, difficulty in QuestionPoolService.iter_cells(category_slug)
+            if counts.get((category.pk, subcategory.pk if subcategory else None, difficulty), 0)
+            < settings.QUIZ_POOL_LOW_WATER
+        ]
+
+
+# Singleton instance
+question_pool_service = QuestionPoolService()
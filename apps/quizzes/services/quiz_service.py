@@ -2,10 +2,17 @@
 Quiz service for handling quiz creation and management
 """
 
-from django.db import transaction
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
 from django.utils.text import slugify
-from apps.quizzes.models import Quiz, Question, Category, Subcategory
+from apps.quizzes.models import Quiz, Question, QuizQuestion, Category, Subcategory
 from apps.quizzes.services.ai_service import ai_generator
+from apps.quizzes.services.duplicate_service import duplicate_detection_service
+from apps.quizzes.services.pool_service import question_pool_service
+from apps.quizzes.services.seen_service import seen_question_service
+from apps.quizzes.services.resilience import AIServiceUnavailable, CircuitOpenError, ai_circuit_breaker
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,7 +25,7 @@ class QuizService:
     
     @staticmethod
     def create_quiz_with_questions(user, category_slug, subcategory_slug=None, 
-                                   difficulty='medium', num_questions=10):
+                                   difficulty='medium', num_questions=10, bank_questions=()):
         """
         Create a new quiz with AI-generated questions
         
@@ -28,6 +35,8 @@ class QuizService:
             subcategory_slug: Subcategory slug (optional)
             difficulty: Difficulty level
             num_questions: Number of questions
+            bank_questions: Bank questions to start the quiz with; only
+                the remaining questions are generated
         
         Returns:
             Quiz object with questions
@@ -47,53 +56,36 @@ class QuizService:
                 )
                 subcategory_name = subcategory.name
             
-            # Generate questions using AI
-            logger.info(f"Generating {num_questions} questions for {category.name}/{subcategory_name}")
-            ai_questions = ai_generator.generate_questions(
-                category=category.name,
-                subcategory=subcategory_name,
-                difficulty=difficulty,
-                num_questions=num_questions
+            # Generate the questions the bank could not provide using AI
+            num_missing = num_questions - len(bank_questions)
+            logger.info(f"Generating {num_missing} questions for {category.name}/{subcategory_name}")
+            ai_questions = QuizService._generate_unique_questions(
+                category, subcategory, difficulty, num_missing, user
             )
             
-            if not ai_questions:
+            if not ai_questions and not bank_questions:
                 raise Exception("No questions were generated")
             
             # Create quiz and questions in a transaction
             with transaction.atomic():
-                # Create quiz
-                quiz_title = f"{category.name}"
-                if subcategory:
-                    quiz_title += f" - {subcategory.name}"
-                quiz_title += f" ({difficulty.capitalize()})"
-                
-                quiz = Quiz.objects.create(
-                    title=quiz_title,
-                    category=category,
-                    subcategory=subcategory,
-                    difficulty=difficulty,
-                    created_by=user,
-                    time_limit=QuizService._calculate_time_limit(num_questions, difficulty),
-                    pass_percentage=QuizService._calculate_pass_percentage(difficulty),
-                )
+                quiz = QuizService._create_quiz(user, category, subcategory, difficulty, num_questions)
                 
-                # Create questions
-                for idx, q_data in enumerate(ai_questions, start=1):
-                    Question.objects.create(
-                        quiz=quiz,
-                        question_text=q_data['question'],
-                        option_a=q_data['options']['A'],
-                        option_b=q_data['options']['B'],
-                        option_c=q_data['options']['C'],
-                        option_d=q_data['options']['D'],
-                        correct_answer=q_data['correct_answer'],
-                        explanation=q_data.get('explanation', ''),
-                        order=idx
+                # Create questions in the bank with one INSERT
+                questions = Question.objects.bulk_create([
+                    Question.from_generated(
+                        q_data,
+                        category=category,
+                        subcategory=subcategory,
+                        difficulty=difficulty
                     )
+                    for q_data in ai_questions
+                ])
+                duplicate_detection_service.index_questions(questions)
+                QuizService._link_questions(quiz, list(bank_questions) + questions)
                 
-                logger.info(f"Created quiz '{quiz.title}' with {len(ai_questions)} questions")
+                logger.info(f"Created quiz '{quiz.title}' with {len(ai_questions)} new and {len(bank_questions)} bank questions")
                 return quiz
-                
+        
         except Category.DoesNotExist:
             raise Exception(f"Category '{category_slug}' not found")
         except Subcategory.DoesNotExist:
@@ -102,6 +94,262 @@ class QuizService:
             logger.error(f"Error creating quiz: {str(e)}")
             raise
     
+    @staticmethod
+    def _generate_unique_questions(category, subcategory, difficulty, num_questions, user=None):
+        """
+        Generate questions, dropping near-duplicates of stored questions
+        
+        Only the dropped slots are requested again, once.
+        
+        Returns:
+            list: Question dictionaries, possibly fewer than num_questions
+        """
+        subcategory_name = subcategory.name if subcategory else None
+        user_id = user.id if user else None
+        questions = duplicate_detection_service.drop_duplicates(
+            category,
+            ai_generator.generate_questions(
+                category=category.name,
+                subcategory=subcategory_name,
+                difficulty=difficulty,
+                num_questions=num_questions,
+                user_id=user_id
+            )
+        )
+        
+        missing = num_questions - len(questions)
+        if missing > 0:
+            logger.info(f"Requesting {missing} replacements for duplicate questions")
+            try:
+                replacements = ai_generator.generate_questions(
+                    category=category.name,
+                    subcategory=subcategory_name,
+                    difficulty=difficulty,
+                    num_questions=missing,
+                    user_id=user_id
+                )
+                questions += duplicate_detection_service.drop_duplicates(category, replacements, accepted=questions)
+            except Exception as e:
+                if not questions:
+                    raise
+                logger.warning(f"Replacement request failed: {str(e)}")
+        
+        return questions[:num_questions]
+    
+    @staticmethod
+    def create_quiz_streaming(user, category, subcategory=None, difficulty='medium', num_questions=10,
+                              bank_questions=(), fill_lock=False):
+        """
+        Create a quiz whose questions are persisted as the AI streams them
+        
+        The bank questions come first; only the remaining questions are
+        streamed. Returns as soon as QUIZ_STREAM_READY_QUESTIONS questions
+        exist, while a background thread keeps adding the rest. The quiz
+        stays in the 'generating' state until the stream is finished.
+        
+        A quiz still without questions after QUIZ_STREAM_READY_TIMEOUT is
+        marked failed and its stream cancelled, so it cannot turn ready
+        after the user was sent elsewhere.
+        
+        Args:
+            fill_lock (bool): The caller holds the cell's refill lock (see
+                QuestionPoolService.acquire_fill); it is released when the
+                stream ends
+        
+        Returns:
+            Quiz object with at least the first questions saved
+        
+        Raises:
+            AIServiceUnavailable: No question arrived in time, or the AI
+                service failed before the first one
+        """
+        try:
+            quiz = QuizService._create_quiz(
+                user, category, subcategory, difficulty, num_questions,
+                generation_status='generating',
+            )
+            QuizService._link_questions(quiz, bank_questions)
+        except Exception:
+            if fill_lock:
+                question_pool_service.release_fill(category, subcategory, difficulty)
+            raise
+        offset = len(bank_questions)
+        num_missing = num_questions - offset
+        min_ready = min(settings.QUIZ_STREAM_READY_QUESTIONS, num_questions)
+        ready = threading.Event()
+        cancelled = threading.Event()
+        errors = []
+        
+        def save(q_data, accepted):
+            if not duplicate_detection_service.drop_duplicates(category, [q_data], accepted=accepted):
+                return False
+            
+            question = Question.from_generated(
+                q_data,
+                category=category,
+                subcategory=subcategory,
+                difficulty=difficulty
+            )
+            question.save()
+            QuizQuestion.objects.create(quiz=quiz, question=question, order=offset + len(accepted) + 1)
+            duplicate_detection_service.index_questions([question])
+            accepted.append(q_data)
+            if offset + len(accepted) >= min_ready:
+                ready.set()
+            return True
+        
+        def consume():
+            accepted = []
+            stream = ai_generator.generate_questions_stream(
+                category=category.name,
+                subcategory=subcategory.name if subcategory else None,
+                difficulty=difficulty,
+                num_questions=num_missing,
+                user_id=user.id
+            )
+            try:
+                dropped = 0
+                for q_data in stream:
+                    if cancelled.is_set():
+                        break
+                    if not save(q_data, accepted):
+                        dropped += 1
+                
+                # Request replacements for the near-duplicates only
+                missing = min(dropped, num_missing - len(accepted))
+                if missing > 0 and not cancelled.is_set():
+                    for q_data in ai_generator.generate_questions(
+                        category=category.name,
+                        subcategory=subcategory.name if subcategory else None,
+                        difficulty=difficulty,
+                        num_questions=missing,
+                        user_id=user.id
+                    ):
+                        save(q_data, accepted)
+            except Exception as e:
+                errors.append(e)
+                logger.error(f"Error streaming quiz questions: {str(e)}")
+            finally:
+                # Ends the upstream stream if the loop stopped early
+                stream.close()
+                saved = len(accepted)
+                # Only a quiz still generating is finished here; a timed out one stays failed
+                generating = Quiz.objects.filter(pk=quiz.pk, generation_status='generating')
+                if saved or offset:
+                    generating.update(generation_status='ready')
+                else:
+                    generating.update(generation_status='failed', is_active=False)
+                logger.info(f"Streamed {saved} questions into quiz '{quiz.title}'")
+                if fill_lock:
+                    question_pool_service.release_fill(category, subcategory, difficulty)
+                ready.set()
+                connection.close()
+        
+        threading.Thread(target=consume, daemon=True).start()
+        if not ready.wait(settings.QUIZ_STREAM_READY_TIMEOUT):
+            timed_out = Quiz.objects.filter(
+                pk=quiz.pk, generation_status='generating', question_count=0
+            ).update(generation_status='failed', is_active=False)
+            if timed_out:
+                cancelled.set()
+                logger.warning(f"No question streamed into quiz '{quiz.title}' in time, cancelled")
+                raise AIServiceUnavailable("AI service did not deliver a question in time")
+        
+        quiz.refresh_from_db(fields=['generation_status', 'is_active', 'question_count'])
+        if quiz.generation_status == 'failed' or not quiz.question_count:
+            if errors and isinstance(errors[0], AIServiceUnavailable):
+                raise errors[0]
+            raise Exception("No questions were generated")
+        
+        return quiz
+    
+    @staticmethod
+    def create_quiz_from_bank(user, category, subcategory=None, difficulty='medium', questions=()):
+        """
+        Create a quiz from sampled bank questions without calling the AI
+        
+        Returns:
+            Quiz object
+        """
+        with transaction.atomic():
+            quiz = QuizService._create_quiz(user, category, subcategory, difficulty, len(questions))
+            QuizService._link_questions(quiz, questions)
+        
+        logger.info(f"Created quiz '{quiz.title}' from question bank")
+        return quiz
+    
+    @staticmethod
+    def create_quiz_from_stored(user, category, subcategory=None, difficulty='medium', num_questions=10,
+                                bank_questions=()):
+        """
+        Create a quiz from the bank questions of the whole category
+        
+        Used while the AI service is unavailable and the subcategory's bank
+        is short. The bank_questions sampled for the subcategory come first,
+        then the rest of the category at the same difficulty, preferring
+        questions the user has not seen; the quiz may come out shorter than
+        requested.
+        
+        Returns:
+            Quiz object, or None if nothing is stored for the category
+        """
+        picked = list(bank_questions)
+        others = Question.objects.filter(category=category, difficulty=difficulty).exclude(subcategory=subcategory)
+        seen = seen_question_service.get_filter(user)
+        seen_texts = {question.question_text for question in picked}
+        for question in question_pool_service.sample_from(others, num_questions - len(picked), seen=seen):
+            # Older quizzes stored their own copies of the same question
+            if question.question_text not in seen_texts:
+                seen_texts.add(question.question_text)
+                picked.append(question)
+        
+        if not picked:
+            return None
+        
+        with transaction.atomic():
+            quiz = QuizService._create_quiz(user, category, subcategory, difficulty, len(picked))
+            QuizService._link_questions(quiz, picked)
+        
+        logger.info(f"Created quiz '{quiz.title}' from {len(picked)} stored questions")
+        return quiz
+    
+    @staticmethod
+    def _link_questions(quiz, questions, start=1):
+        """
+        Place bank questions in a quiz, numbered from position start
+        
+        bulk_create skips the signal that maintains Quiz.question_count,
+        so the count is updated here with a single UPDATE.
+        """
+        links = QuizQuestion.objects.bulk_create([
+            QuizQuestion(quiz=quiz, question=question, order=idx)
+            for idx, question in enumerate(questions, start=start)
+        ])
+        if links:
+            Quiz.objects.filter(pk=quiz.pk).update(question_count=F('question_count') + len(links))
+            quiz.question_count += len(links)
+    
+    @staticmethod
+    def _create_quiz(user, category, subcategory, difficulty, num_questions, **fields):
+        """
+        Create the quiz row for a category/subcategory/difficulty
+        """
+        quiz_title = f"{category.name}"
+        if subcategory:
+            quiz_title += f" - {subcategory.name}"
+        quiz_title += f" ({difficulty.capitalize()})"
+        
+        return Quiz.objects.create(
+            title=quiz_title,
+            category=category,
+            subcategory=subcategory,
+            difficulty=difficulty,
+            created_by=user,
+            time_limit=QuizService._calculate_time_limit(num_questions, difficulty),
+            pass_percentage=QuizService._calculate_pass_percentage(difficulty),
+            **fields
+        )
+    
     @staticmethod
     def _calculate_time_limit(num_questions, difficulty):
         """
@@ -139,10 +387,14 @@ class QuizService:
     def get_or_create_quiz(user, category_slug, subcategory_slug=None,
                            difficulty='medium', num_questions=10):
         """
-        Get existing quiz or create new one
+        Create a quiz by sampling the question bank
         
-        This checks if a quiz with the same parameters exists
-        to avoid regenerating questions unnecessarily
+        Every quiz gets its own random selection of the cell's bank
+        questions, preferring ones the user has not been quizzed on yet.
+        The AI is only called when the bank cannot cover num_questions,
+        and then only for the missing questions. Concurrent quizzes of a
+        short cell coalesce: one generates into the bank, the others wait
+        for it and sample what it added.
         """
         try:
             category = Category.objects.get(slug=category_slug)
@@ -151,24 +403,58 @@ class QuizService:
             if subcategory_slug:
                 subcategory = Subcategory.objects.get(slug=subcategory_slug, category=category)
             
-            # Try to find existing quiz with same parameters
-            quiz = Quiz.objects.filter(
-                category=category,
-                subcategory=subcategory,
-                difficulty=difficulty,
-                is_active=True
-            ).first()
-            
-            # Check if it has the right number of questions
-            if quiz and quiz.total_questions == num_questions:
-                logger.info(f"Using existing quiz: {quiz.title}")
-                return quiz
-            
-            # Create new quiz
-            return QuizService.create_quiz_with_questions(
-                user, category_slug, subcategory_slug, difficulty, num_questions
+            # Sample the bank and top it up in the background
+            seen = seen_question_service.get_filter(user)
+            bank_questions = question_pool_service.sample_questions(
+                category, subcategory, difficulty, num_questions, seen=seen
             )
+            if len(bank_questions) == num_questions:
+                question_pool_service.schedule_refill(category, subcategory, difficulty)
+                return QuizService.create_quiz_from_bank(
+                    user, category, subcategory, difficulty, bank_questions
+                )
             
+            # Bank ran short, generate the missing questions inline
+            try:
+                if ai_circuit_breaker.is_open:
+                    raise CircuitOpenError("AI service circuit is open")
+                
+                # Only one request per cell generates; the others wait for it
+                fill_lock = question_pool_service.acquire_fill(category, subcategory, difficulty)
+                if not fill_lock:
+                    filled = question_pool_service.wait_for_fill(category, subcategory, difficulty, num_questions)
+                    bank_questions = question_pool_service.sample_questions(
+                        category, subcategory, difficulty, num_questions, seen=seen
+                    )
+                    if len(bank_questions) == num_questions:
+                        return QuizService.create_quiz_from_bank(
+                            user, category, subcategory, difficulty, bank_questions
+                        )
+                    if not filled:
+                        raise AIServiceUnavailable("Timed out waiting for the question bank to be filled")
+                
+                if settings.QUIZ_STREAMING_GENERATION:
+                    return QuizService.create_quiz_streaming(
+                        user, category, subcategory, difficulty, num_questions, bank_questions, fill_lock
+                    )
+                
+                try:
+                    return QuizService.create_quiz_with_questions(
+                        user, category_slug, subcategory_slug, difficulty, num_questions, bank_questions
+                    )
+                finally:
+                    if fill_lock:
+                        question_pool_service.release_fill(category, subcategory, difficulty)
+            except AIServiceUnavailable as e:
+                # AI is down; serve what is already stored instead of failing
+                logger.warning(f"AI service unavailable ({str(e)}), using stored questions")
+                quiz = QuizService.create_quiz_from_stored(
+                    user, category, subcategory, difficulty, num_questions, bank_questions
+                )
+                if quiz:
+                    return quiz
+                raise
+        
         except Exception as e:
             logger.error(f"Error in get_or_create_quiz: {str(e)}")
             raise
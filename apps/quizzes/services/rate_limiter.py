@@ -0,0 +1,169 @@
+"""
+Shared rate limiter for AI calls across workers
+
+Two token buckets kept in the shared cache cap requests per minute and
+tokens per minute for the whole deployment. Calls are tagged with a
+priority class:
+
+- interactive: a user is waiting on a page (answer explanations)
+- generation: quiz creation on the request path
+- background: pool refills and prefill jobs
+
+Lower classes must leave a reserved share of each bucket untouched
+(AI_RATE_LIMIT_RESERVE), so they queue while interactive traffic is
+using the budget instead of competing with it. Per-user daily request and
+token quotas are enforced on top.
+"""
+
+import time
+import uuid
+from datetime import date
+from django.conf import settings
+from django.core.cache import cache
+from apps.quizzes.services.resilience import AIServiceUnavailable
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_GENERATION = 'generation'
+PRIORITY_BACKGROUND = 'background'
+
+
+class RateLimitExceeded(AIServiceUnavailable):
+    """The call could not get a rate limit slot in time or the user is over quota"""
+
+
+class AIRateLimiter:
+    """
+    Cache-backed token-bucket limiter with priority classes
+    """
+    
+    LOCK_KEY = 'ai_rate_limit_lock'
+    
+    def acquire(self, priority, estimated_tokens, user_id=None):
+        """
+        Wait for a request slot and estimated_tokens of token budget
+        
+        Args:
+            priority (str): One of the PRIORITY_* classes
+            estimated_tokens (int): Prompt plus max completion tokens
+            user_id (int): User the call is made for, if any
+        
+        Raises:
+            RateLimitExceeded: The user is over quota, or no slot freed up
+                within the priority's AI_RATE_LIMIT_MAX_WAIT
+        """
+        if user_id is not None:
+            self._check_user_quota(user_id)
+        
+        deadline = time.monotonic() + settings.AI_RATE_LIMIT_MAX_WAIT[priority]
+        reserve = settings.AI_RATE_LIMIT_RESERVE[priority]
+        
+        while True:
+            wait = self._take(estimated_tokens, reserve)
+            if wait is None:
+                break
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"AI rate limit reached for {priority} work")
+            
+            logger.debug(f"Queued {priority} AI call for {wait:.2f}s")
+            time.sleep(min(wait, 1.0))
+        
+        if user_id is not None:
+            self._add_usage(f"ai_user_requests_{user_id}_{date.today()}", 1)
+    
+    def try_acquire(self, priority, estimated_tokens):
+        """
+        Take a slot only if one is free right now, for optional extra calls
+        such as hedged requests
+        
+        Returns:
+            bool: True if the slot was taken
+        """
+        return self._take(estimated_tokens, settings.AI_RATE_LIMIT_RESERVE[priority]) is None
+    
+    def settle(self, estimated_tokens, actual_tokens, user_id=None):
+        """
+        Correct the token bucket and user budget once real usage is known
+        """
+        if actual_tokens != estimated_tokens:
+            self._take(actual_tokens - estimated_tokens, 0, force=True)
+        if user_id is not None:
+            self._add_usage(f"ai_user_tokens_{user_id}_{date.today()}", actual_tokens)
+    
+    def _check_user_quota(self, user_id):
+        today = date.today()
+        requests = cache.get(f"ai_user_requests_{user_id}_{today}", 0)
+        tokens = cache.get(f"ai_user_tokens_{user_id}_{today}", 0)
+        
+        if requests >= settings.AI_USER_DAILY_REQUESTS or tokens >= settings.AI_USER_DAILY_TOKENS:
+            raise RateLimitExceeded(f"Daily AI quota reached for user {user_id}")
+    
+    def _add_usage(self, key, amount):
+        cache.add(key, 0, 86400)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, 86400)
+    
+    def _take(self, tokens, reserve, force=False):
+        """
+        Take one request and tokens from the shared buckets
+        
+        Returns:
+            None if taken, otherwise the seconds until enough is refilled
+        """
+        buckets = [
+            ('ai_rate_requests', settings.AI_RATE_LIMIT_RPM, 0 if force else 1),
+            ('ai_rate_tokens', settings.AI_RATE_LIMIT_TPM, tokens),
+        ]
+        
+        with self._lock():
+            now = time.time()
+            levels = []
+            wait = 0.0
+            for key, per_minute, amount in buckets:
+                level, updated = cache.get(key) or (per_minute, now)
+                level = min(per_minute, level + (now - updated) * per_minute / 60)
+                levels.append(level)
+                
+                # Lower priorities leave the reserved share for higher ones
+                needed = min(amount + reserve * per_minute, per_minute)
+                if level < needed:
+                    wait = max(wait, (needed - level) * 60 / per_minute)
+            
+            if wait and not force:
+                return wait
+            
+            for (key, per_minute, amount), level in zip(buckets, levels):
+                cache.set(key, (level - amount, now), 120)
+            return None
+    
+    def _lock(self):
+        return _CacheLock(self.LOCK_KEY)
+
+
+class _CacheLock:
+    """Short spin lock in the shared cache guarding a bucket update"""
+    
+    def __init__(self, key):
+        self.key = key
+        self.token = uuid.uuid4().hex
+    
+    def __enter__(self):
+        deadline = time.monotonic() + 2
+        while not cache.add(self.key, self.token, 5):
+            if time.monotonic() > deadline:
+                # A crashed holder; its lock expires on its own shortly
+                break
+            time.sleep(0.005)
+        return self
+    
+    def __exit__(self, *exc):
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+
+# Limiter shared by every AI call
+ai_rate_limiter = AIRateLimiter()
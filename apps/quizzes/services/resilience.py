@@ -0,0 +1,139 @@
+"""
+Resilience helpers for AI calls: bounded retries with jitter and a
+circuit breaker shared by all workers through the cache
+
+When the upstream keeps failing the breaker opens and calls fail fast with
+CircuitOpenError instead of pinning gunicorn workers until the 30s kill;
+callers fall back to stored questions while it is open.
+"""
+
+import random
+import time
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AIServiceUnavailable(Exception):
+    """The AI upstream failed after retries or is currently switched off"""
+
+
+class CircuitOpenError(AIServiceUnavailable):
+    """The circuit breaker is open and the call was not attempted"""
+
+
+class CircuitBreaker:
+    """
+    Cache-backed circuit breaker
+    
+    Opens after AI_CIRCUIT_FAILURE_THRESHOLD failures within
+    AI_CIRCUIT_FAILURE_WINDOW seconds and stays open for AI_CIRCUIT_COOLDOWN
+    seconds. After the cooldown a single trial call is let through
+    (half-open); its outcome closes or re-opens the breaker.
+    """
+    
+    def __init__(self, name):
+        self.name = name
+        self._failures_key = f"circuit_{name}_failures"
+        self._open_key = f"circuit_{name}_open"
+        self._trial_key = f"circuit_{name}_trial"
+    
+    @property
+    def is_open(self):
+        return bool(cache.get(self._open_key))
+    
+    def before_call(self):
+        """
+        Raise CircuitOpenError if the call must not be attempted
+        """
+        if self.is_open:
+            raise CircuitOpenError(f"AI service circuit '{self.name}' is open")
+        
+        # Half-open: once a cooldown has passed only one trial runs at a time
+        if cache.get(self._failures_key, 0) >= settings.AI_CIRCUIT_FAILURE_THRESHOLD:
+            if not cache.add(self._trial_key, True, settings.AI_CIRCUIT_COOLDOWN):
+                raise CircuitOpenError(f"AI service circuit '{self.name}' is half-open")
+    
+    def record_success(self):
+        cache.delete_many([self._failures_key, self._trial_key])
+    
+    def release_trial(self):
+        """Let the next half-open trial through once this call is over"""
+        cache.delete(self._trial_key)
+    
+    def record_failure(self):
+        cache.add(self._failures_key, 0, settings.AI_CIRCUIT_FAILURE_WINDOW)
+        try:
+            failures = cache.incr(self._failures_key)
+        except ValueError:
+            failures = 1
+            cache.set(self._failures_key, failures, settings.AI_CIRCUIT_FAILURE_WINDOW)
+        
+        if failures >= settings.AI_CIRCUIT_FAILURE_THRESHOLD:
+            cache.set(self._open_key, True, settings.AI_CIRCUIT_COOLDOWN)
+            cache.delete(self._trial_key)
+            logger.warning(f"AI service circuit '{self.name}' opened after {failures} failures")
+
+
+def call_with_retries(func, retryable, breaker, deadline=None):
+    """
+    Call func with bounded, jittered retries behind a circuit breaker
+    
+    Every attempt is passed the time it may take: AI_READ_TIMEOUT, cut to
+    what is left of the deadline, so the retries together never outlive
+    it. A call that exhausts its retries counts as one
+    failure for the breaker, however many attempts it made; a
+    non-retryable error (a bad request, say) means the upstream answered
+    and counts as a success.
+    
+    Args:
+        func (callable): The upstream call, taking the attempt's timeout
+            in seconds
+        retryable (tuple): Exception types worth retrying (timeouts,
+            connection errors, rate limits, 5xx)
+        breaker (CircuitBreaker): Breaker guarding the upstream
+        deadline (float): time.monotonic() by which every attempt must be
+            done; AI_REQUEST_DEADLINE from now by default
+    
+    Returns:
+        The result of func()
+    
+    Raises:
+        CircuitOpenError: The breaker is open
+        AIServiceUnavailable: Every attempt failed with a retryable error
+    """
+    breaker.before_call()
+    if deadline is None:
+        deadline = time.monotonic() + settings.AI_REQUEST_DEADLINE
+    attempt = 0
+    
+    try:
+        while True:
+            try:
+                result = func(min(settings.AI_READ_TIMEOUT, deadline - time.monotonic()))
+                breaker.record_success()
+                return result
+            except retryable as e:
+                attempt += 1
+                
+                # Full jitter: sleep a random share of the exponential backoff
+                delay = random.uniform(0, min(settings.AI_RETRY_MAX_DELAY, settings.AI_RETRY_BASE_DELAY * 2 ** attempt))
+                remaining = deadline - time.monotonic() - delay
+                if attempt > settings.AI_MAX_RETRIES or remaining < settings.AI_CONNECT_TIMEOUT or breaker.is_open:
+                    breaker.record_failure()
+                    raise AIServiceUnavailable(f"AI service unavailable: {str(e)}") from e
+                
+                logger.warning(f"AI call failed ({str(e)}), retrying in {delay:.2f}s ({attempt}/{settings.AI_MAX_RETRIES})")
+                time.sleep(delay)
+            except Exception:
+                breaker.record_success()
+                raise
+    finally:
+        # A half-open trial must not stay claimed past its call, whatever the outcome
+        breaker.release_trial()
+
+
+# Breaker shared by every AI call
+ai_circuit_breaker = CircuitBreaker('ai')
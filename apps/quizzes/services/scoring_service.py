@@ -2,8 +2,11 @@
 Scoring service for quiz attempts
 """
 
+from decimal import Decimal
+from django.db.models import Count, Max, Q
 from django.utils import timezone
 from apps.quizzes.models import UserQuizAttempt, UserAnswer
+from apps.quizzes.services.seen_service import seen_question_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,6 +22,9 @@ class ScoringService:
         """
         Submit and score a quiz attempt
         
+        Submitting an attempt that is already completed changes nothing and
+        returns the stored result.
+        
         Args:
             attempt: UserQuizAttempt object
         
@@ -26,30 +32,66 @@ class ScoringService:
             Dictionary with score results
         """
         try:
-            # Mark as completed
-            attempt.mark_completed()
-            
-            # Calculate score
-            score = attempt.calculate_score()
+            # Score and total in one aggregate, with the quiz's pass mark
+            totals = UserQuizAttempt.objects.filter(pk=attempt.pk).aggregate(
+                total=Count('answers'),
+                score=Count('answers', filter=Q(answers__is_correct=True)),
+                pass_percentage=Max('quiz__pass_percentage'),
+            )
             
-            result = {
-                'attempt_id': attempt.id,
-                'score': attempt.score,
-                'total_questions': attempt.total_questions,
-                'percentage': float(attempt.percentage),
-                'passed': attempt.passed,
-                'time_taken': attempt.time_taken,
-                'correct_answers': attempt.score,
-                'incorrect_answers': attempt.total_questions - attempt.score,
+            fields = {
+                'completed': True,
+                'completed_at': timezone.now(),
+                'score': totals['score'],
+                'total_questions': totals['total'],
             }
+            if attempt.started_at:
+                fields['time_taken'] = int((fields['completed_at'] - attempt.started_at).total_seconds())
+            if totals['total'] > 0:
+                fields['percentage'] = (Decimal(totals['score'] * 100) / totals['total']).quantize(Decimal('0.01'))
+                fields['passed'] = totals['score'] * 100 >= totals['pass_percentage'] * totals['total']
+            
+            # Only the submit that flips completed writes the results, so a
+            # double submit (double click, timer plus click) scores once
+            won = UserQuizAttempt.objects.filter(pk=attempt.pk, completed=False).update(**fields)
+            if not won:
+                logger.info(f"Attempt {attempt.id} was already submitted")
+                attempt.refresh_from_db()
+                return ScoringService._result(attempt)
+            
+            for name, value in fields.items():
+                setattr(attempt, name, value)
+            
+            # Remember the questions so later quizzes prefer unseen ones
+            try:
+                seen_question_service.mark_seen(
+                    attempt.user,
+                    attempt.quiz.quiz_questions.values_list('question_id', flat=True)
+                )
+            except Exception as e:
+                logger.warning(f"Error updating seen questions: {str(e)}")
             
             logger.info(f"Quiz submitted: {attempt.user.username} scored {attempt.score}/{attempt.total_questions}")
-            return result
+            return ScoringService._result(attempt)
             
         except Exception as e:
             logger.error(f"Error submitting quiz: {str(e)}")
             raise
     
+    @staticmethod
+    def _result(attempt):
+        """Score summary of a submitted attempt"""
+        return {
+            'attempt_id': attempt.id,
+            'score': attempt.score,
+            'total_questions': attempt.total_questions,
+            'percentage': float(attempt.percentage),
+            'passed': attempt.passed,
+            'time_taken': attempt.time_taken,
+            'correct_answers': attempt.score,
+            'incorrect_answers': attempt.total_questions - attempt.score,
+        }
+    
     @staticmethod
     def save_answer(attempt, question, selected_answer):
         """
@@ -108,14 +150,18 @@ class ScoringService:
             Dictionary with detailed results
         """
         try:
-            answers = attempt.answers.select_related('question').order_by('question__order')
+            positions = dict(attempt.quiz.quiz_questions.values_list('question_id', 'order'))
+            answers = sorted(
+                attempt.answers.select_related('question'),
+                key=lambda answer: positions.get(answer.question_id, 0)
+            )
             
             questions_data = []
             for answer in answers:
                 question = answer.question
                 questions_data.append({
                     'id': question.id,
-                    'order': question.order,
+                    'order': positions.get(question.id, 0),
                     'question_text': question.question_text,
                     'options': question.get_options(),
                     'selected_answer': answer.selected_answer,
@@ -0,0 +1,104 @@
+"""
+Per-user filter of the questions a user has already been quizzed on
+
+Every user has a Bloom filter (SeenQuestionFilter) over the ids of the
+questions in the quizzes they submitted. Sampling a quiz checks candidate
+questions against it in constant time, however long the user's history is,
+and prefers the ones it does not contain. A false positive only makes an
+unseen question look seen, so it is served a little less eagerly.
+
+Once more than QUIZ_SEEN_FILTER_CAPACITY questions were added, the filter
+is cleared and starts over: the oldest history is forgotten instead of the
+false-positive rate climbing until every question looks seen.
+"""
+
+import hashlib
+from django.conf import settings
+from django.db import transaction
+from apps.quizzes.models import SeenQuestionFilter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over integer ids
+    """
+    
+    def __init__(self, bits=None, num_bits=None, num_hashes=None):
+        num_bits = num_bits or settings.QUIZ_SEEN_FILTER_BITS
+        self.bits = bytearray(bits) if bits else bytearray(num_bits // 8)
+        self.num_bits = len(self.bits) * 8
+        self.num_hashes = num_hashes or settings.QUIZ_SEEN_FILTER_HASHES
+    
+    def add(self, item):
+        """Add an id to the filter"""
+        for position in self._positions(item):
+            self.bits[position // 8] |= 1 << (position % 8)
+    
+    def __contains__(self, item):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(item))
+    
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+
+class SeenQuestionService:
+    """
+    Service class for the per-user seen question filters
+    """
+    
+    @staticmethod
+    def get_filter(user):
+        """
+        Return the seen question filter of a user
+        
+        Returns:
+            BloomFilter, or None if the user has not submitted a quiz yet
+        """
+        if user is None or not user.is_authenticated:
+            return None
+        
+        row = SeenQuestionFilter.objects.filter(user=user).only('bits').first()
+        return BloomFilter(row.bits) if row else None
+    
+    @staticmethod
+    def mark_seen(user, question_ids):
+        """
+        Add questions to a user's seen filter
+        
+        The row is locked while it is updated, so two quizzes submitted
+        at the same time cannot drop each other's questions.
+        """
+        question_ids = list(question_ids)
+        if not question_ids:
+            return
+        
+        with transaction.atomic():
+            row, _ = SeenQuestionFilter.objects.select_for_update().get_or_create(
+                user=user,
+                defaults={'bits': bytes(BloomFilter().bits)}
+            )
+            
+            if row.num_items + len(question_ids) > settings.QUIZ_SEEN_FILTER_CAPACITY:
+                logger.info(f"Clearing seen question filter of user {user.id} after {row.num_items} questions")
+                bloom = BloomFilter()
+                row.num_items = 0
+            else:
+                bloom = BloomFilter(row.bits)
+            
+            for question_id in question_ids:
+                bloom.add(question_id)
+            
+            row.bits = bytes(bloom.bits)
+            row.num_items += len(question_ids)
+            row.save(update_fields=['bits', 'num_items', 'updated_at'])
+
+
+# Singleton instance
+seen_question_service = SeenQuestionService()
@@ -0,0 +1,94 @@
+"""
+Cross-worker single-flight coalescing for expensive AI calls
+
+Only one caller per key runs the computation; every other gunicorn worker
+or process that asks for the same key waits for the result to appear in
+the shared cache instead of issuing its own OpenAI request.
+"""
+
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def acquire_lock(key):
+    """
+    Try to become the leader for a key
+    
+    Returns:
+        str: Lock token if acquired, otherwise None
+    """
+    token = uuid.uuid4().hex
+    if cache.add(f"{key}_lock", token, settings.AI_SINGLE_FLIGHT_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    """Release a lock, unless it expired and another leader took over"""
+    if cache.get(f"{key}_lock") == token:
+        cache.delete(f"{key}_lock")
+
+
+def wait_for_result(key):
+    """
+    Wait for the leader to publish a result under key
+    
+    Returns:
+        The cached result, or None if the leader released its lock without
+        publishing one (failure) or the wait timed out
+    """
+    deadline = time.monotonic() + settings.AI_SINGLE_FLIGHT_WAIT_TIMEOUT
+    
+    while time.monotonic() < deadline:
+        result = cache.get(key)
+        if result is not None:
+            return result
+        if cache.get(f"{key}_lock") is None:
+            return cache.get(key)
+        time.sleep(settings.AI_SINGLE_FLIGHT_POLL_INTERVAL)
+    
+    return None
+
+
+def single_flight(key, compute, timeout):
+    """
+    Return the cached value for key, computing it at most once across workers
+    
+    Args:
+        key (str): Cache key the result is stored under
+        compute (callable): Produces the result; only the leader calls it
+        timeout (int): Cache timeout for the result in seconds
+    
+    Returns:
+        The result of compute(), possibly produced by another worker
+    """
+    deadline = time.monotonic() + settings.AI_SINGLE_FLIGHT_WAIT_TIMEOUT
+    
+    while True:
+        result = cache.get(key)
+        if result is not None:
+            return result
+        
+        token = acquire_lock(key)
+        if token:
+            try:
+                result = compute()
+                if result:
+                    cache.set(key, result, timeout)
+                return result
+            finally:
+                release_lock(key, token)
+        
+        logger.info(f"Waiting for in-flight generation of {key}")
+        result = wait_for_result(key)
+        if result is not None:
+            return result
+        
+        # Leader failed; retry as a leader candidate while time remains
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Timed out waiting for in-flight generation of {key}")
@@ -0,0 +1,163 @@
+"""
+Immutable snapshots of a quiz's questions for the take-quiz page
+
+A quiz's questions do not change once it is generated, so the page reads
+them from a serialized snapshot instead of the question tables. Snapshots
+are kept in a small in-process LRU and in the shared cache, under a key
+versioned by the quiz's updated_at: editing a quiz or one of its questions
+in the admin touches the quiz (see invalidate), which moves it to a new key
+and leaves the old snapshot to expire.
+
+Snapshots carry question texts and options only; correct answers and
+explanations never leave the server with them.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from apps.quizzes.models import QuizQuestion
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the serialized layout changes
+SNAPSHOT_FORMAT = 1
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+class QuizSnapshotService:
+    """
+    Service class for cached quiz question snapshots
+    """
+    
+    @staticmethod
+    def get(quiz):
+        """
+        Return the snapshot of a quiz
+        
+        Quizzes still being generated are read from the DB every time and
+        never cached, since questions are being added to them.
+        
+        Returns:
+            dict: 'version' and 'questions', a list of dicts with id, order,
+                question_text and options
+        """
+        if quiz.is_generating:
+            return QuizSnapshotService._build(quiz)
+        
+        key = QuizSnapshotService.key(quiz)
+        with _local_lock:
+            snapshot = _local.get(key)
+            if snapshot is not None:
+                _local.move_to_end(key)
+                return snapshot
+        
+        data = cache.get(key)
+        if data is None:
+            snapshot = QuizSnapshotService._build(quiz)
+            cache.set(key, QuizSnapshotService._dumps(snapshot), settings.QUIZ_SNAPSHOT_CACHE_TIMEOUT)
+        else:
+            snapshot = QuizSnapshotService._loads(data)
+        
+        with _local_lock:
+            _local[key] = snapshot
+            while len(_local) > settings.QUIZ_SNAPSHOT_LOCAL_ENTRIES:
+                _local.popitem(last=False)
+        return snapshot
+    
+    @staticmethod
+    def payload(quiz):
+        """
+        Return the client JSON payload of a quiz's snapshot
+        
+        Returns:
+            tuple: (JSON bytes, strong ETag from their SHA-256)
+        """
+        snapshot = QuizSnapshotService.get(quiz)
+        body = json.dumps(
+            {'quiz_id': quiz.pk, 'version': snapshot['version'], 'questions': snapshot['questions']},
+            separators=(',', ':'),
+        ).encode()
+        return body, f'"{hashlib.sha256(body).hexdigest()}"'
+    
+    @staticmethod
+    def key(quiz):
+        """Return the cache key of a quiz's current snapshot"""
+        return f"quiz_snapshot_{SNAPSHOT_FORMAT}_{quiz.pk}_{QuizSnapshotService.version(quiz)}"
+    
+    @staticmethod
+    def version(quiz):
+        """Return the snapshot version of a quiz, changed by invalidate"""
+        return int(quiz.updated_at.timestamp() * 1000000)
+    
+    @staticmethod
+    def invalidate(quizzes):
+        """
+        Move quizzes to a new snapshot version after their questions changed
+        
+        Args:
+            quizzes: Quiz queryset
+        """
+        updated = quizzes.update(updated_at=timezone.now())
+        if updated:
+            logger.info(f"Invalidated {updated} quiz snapshots")
+    
+    @staticmethod
+    def _build(quiz):
+        links = (
+            QuizQuestion.objects.filter(quiz=quiz)
+            .order_by('order')
+            .values_list(
+                'order', 'question_id', 'question__question_text', 'question__option_a',
+                'question__option_b', 'question__option_c', 'question__option_d'
+            )
+        )
+        return {
+            'version': QuizSnapshotService.version(quiz),
+            'questions': [
+                {
+                    'id': question_id,
+                    'order': order,
+                    'question_text': text,
+                    'options': {'A': option_a, 'B': option_b, 'C': option_c, 'D': option_d},
+                }
+                for order, question_id, text, option_a, option_b, option_c, option_d in links
+            ],
+        }
+    
+    @staticmethod
+    def _dumps(snapshot):
+        """Serialize a snapshot as compact JSON, one array per question"""
+        return json.dumps(
+            [snapshot['version'], [
+                [q['id'], q['order'], q['question_text'], *q['options'].values()]
+                for q in snapshot['questions']
+            ]],
+            separators=(',', ':'),
+        )
+    
+    @staticmethod
+    def _loads(data):
+        version, rows = json.loads(data)
+        return {
+            'version': version,
+            'questions': [
+                {
+                    'id': question_id,
+                    'order': order,
+                    'question_text': text,
+                    'options': dict(zip('ABCD', options)),
+                }
+                for question_id, order, text, *options in rows
+            ],
+        }
+
+
+# Singleton instance
+quiz_snapshot_service = QuizSnapshotService()
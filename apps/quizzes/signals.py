@@ -0,0 +1,39 @@
+"""
+Signals for quizzes app
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Quiz, QuizQuestion
+
+
+@receiver(post_save, sender=QuizQuestion)
+def increment_question_count(sender, instance, created, **kwargs):
+    """
+    Count a question linked to a quiz
+    
+    Touching updated_at also moves the quiz to a new snapshot version.
+    bulk_create sends no signal; QuizService._link_questions adds its
+    links to the count itself.
+    """
+    if created:
+        Quiz.objects.filter(pk=instance.quiz_id).update(
+            question_count=F('question_count') + 1,
+            updated_at=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=QuizQuestion)
+def decrement_question_count(sender, instance, **kwargs):
+    """
+    Uncount a question unlinked from a quiz
+    
+    Also runs for links removed by deleting their question or a queryset,
+    since the deletion collector sends post_delete for every row.
+    """
+    Quiz.objects.filter(pk=instance.quiz_id, question_count__gt=0).update(
+        question_count=F('question_count') - 1,
+        updated_at=timezone.now()
+    )
@@ -0,0 +1,238 @@
+"""
+Tests for the quizzes app
+"""
+
+import threading
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.core.cache import cache
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from apps.quizzes.models import Category, Question, Quiz, QuizQuestion, Subcategory, UserAnswer, UserQuizAttempt
+from apps.quizzes.services.ai_service import ai_generator
+from apps.quizzes.services.llm_providers import StubProvider
+from apps.quizzes.services import minhash
+from apps.quizzes.services.quiz_service import quiz_service
+from apps.quizzes.services.resilience import AIServiceUnavailable, CircuitBreaker, call_with_retries
+from apps.quizzes.services.scoring_service import scoring_service
+from apps.quizzes.services.seen_service import seen_question_service
+
+User = get_user_model()
+
+
+class SubmitQuizConcurrencyTest(TransactionTestCase):
+    """
+    Parallel submits of one attempt (double click, timer plus click) must
+    score it exactly once
+    """
+
+    num_threads = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', email='student@example.com', password='pass12345')
+        category = Category.objects.create(name='Academic')
+        quiz = Quiz.objects.create(
+            title='Python Basics', category=category, difficulty='easy', created_by=self.user, pass_percentage=60
+        )
+
+        questions = Question.objects.bulk_create([
+            Question(
+                category=category, difficulty='easy', question_text=f'Question {number}?',
+                option_a='One', option_b='Two', option_c='Three', option_d='Four', correct_answer='A'
+            )
+            for number in range(1, 5)
+        ])
+        for number, question in enumerate(questions, start=1):
+            QuizQuestion.objects.create(quiz=quiz, question=question, order=number)
+
+        self.attempt = UserQuizAttempt.objects.create(user=self.user, quiz=quiz, total_questions=len(questions))
+        for question, answer in zip(questions, 'AABC'):
+            UserAnswer.objects.create(attempt=self.attempt, question=question, selected_answer=answer)
+
+    def test_exactly_one_submit_wins(self):
+        barrier = threading.Barrier(self.num_threads)
+        results = []
+        errors = []
+        updates = []
+        update = QuerySet.update
+
+        def record_update(queryset, **kwargs):
+            rows = update(queryset, **kwargs)
+            if queryset.model is UserQuizAttempt:
+                updates.append(rows)
+            return rows
+
+        def submit():
+            try:
+                # Every request loads its own, not yet completed copy
+                attempt = UserQuizAttempt.objects.get(pk=self.attempt.pk)
+                barrier.wait()
+                results.append(scoring_service.submit_quiz(attempt))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=record_update), \
+                mock.patch.object(seen_question_service, 'mark_seen') as mark_seen:
+            threads = [threading.Thread(target=submit) for _ in range(self.num_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(updates), self.num_threads)
+        self.assertEqual(sorted(updates), [0] * (self.num_threads - 1) + [1])
+        mark_seen.assert_called_once()
+
+        self.assertEqual(len(results), self.num_threads)
+        self.assertEqual({(result['score'], result['percentage'], result['passed']) for result in results}, {(2, 50.0, False)})
+
+        self.attempt.refresh_from_db()
+        self.assertTrue(self.attempt.completed)
+        self.assertEqual(self.attempt.score, 2)
+        self.assertEqual(self.attempt.total_questions, 4)
+
+    def test_resubmit_returns_stored_result(self):
+        first = scoring_service.submit_quiz(UserQuizAttempt.objects.get(pk=self.attempt.pk))
+        completed_at = UserQuizAttempt.objects.get(pk=self.attempt.pk).completed_at
+
+        with mock.patch.object(seen_question_service, 'mark_seen') as mark_seen:
+            second = scoring_service.submit_quiz(self.attempt)
+
+        self.assertEqual(first, second)
+        mark_seen.assert_not_called()
+        self.assertEqual(UserQuizAttempt.objects.get(pk=self.attempt.pk).completed_at, completed_at)
+
+
+@override_settings(
+    AI_PROVIDER='stub', AI_STUB_LATENCY_MEDIAN=0.5, AI_STUB_LATENCY_SIGMA=0.01, AI_STUB_ERROR_RATE=0.0,
+    AI_LEDGER_ENABLED=False, QUIZ_POOL_BACKGROUND_REFILL=False, QUIZ_STREAMING_GENERATION=True,
+)
+class ColdQuizCoalescingTest(TransactionTestCase):
+    """
+    Concurrent quizzes of an empty pool cell must share one upstream
+    generation through the question bank
+    """
+
+    num_threads = 6
+    num_questions = 5
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Academic')
+        self.subcategory = Subcategory.objects.create(category=self.category, name='Python')
+        self.users = [
+            User.objects.create_user(username=f'student{number}', email=f'student{number}@example.com', password='pass12345')
+            for number in range(self.num_threads)
+        ]
+
+    def test_one_upstream_call_fills_the_cell(self):
+        barrier = threading.Barrier(self.num_threads)
+        quizzes = []
+        errors = []
+        provider = StubProvider()
+
+        def start(user):
+            try:
+                barrier.wait()
+                quizzes.append(quiz_service.get_or_create_quiz(
+                    user, self.category.slug, self.subcategory.slug, 'easy', self.num_questions
+                ))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with mock.patch.object(ai_generator, '_provider', provider), \
+                mock.patch.object(provider, 'complete', wraps=provider.complete) as complete, \
+                mock.patch.object(provider, 'stream', wraps=provider.stream) as stream:
+            threads = [threading.Thread(target=start, args=(user,)) for user in self.users]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            # The leader's stream finishes in the background
+            deadline = time.monotonic() + 10
+            while Quiz.objects.filter(generation_status='generating').exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(stream.call_count + complete.call_count, 1)
+        self.assertEqual(Question.objects.count(), self.num_questions)
+        self.assertEqual(len(quizzes), self.num_threads)
+        self.assertEqual(
+            set(Quiz.objects.values_list('generation_status', 'question_count')), {('ready', self.num_questions)}
+        )
+
+
+class TransientError(Exception):
+    pass
+
+
+@override_settings(AI_CIRCUIT_FAILURE_THRESHOLD=2, AI_RETRY_BASE_DELAY=0.001)
+class CircuitBreakerTest(SimpleTestCase):
+    """
+    A half-open breaker must close again when the upstream answers, even
+    with an error that is not an outage
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('test')
+
+    def fail(self, timeout):
+        raise TransientError('upstream down')
+
+    def test_non_retryable_error_closes_half_open_breaker(self):
+        for _ in range(2):
+            with self.assertRaises(AIServiceUnavailable):
+                call_with_retries(self.fail, (TransientError,), self.breaker)
+        self.assertTrue(self.breaker.is_open)
+
+        # Cooldown over: the next call is the half-open trial
+        cache.delete(self.breaker._open_key)
+
+        def bad_request(timeout):
+            raise ValueError('400 Bad Request')
+
+        with self.assertRaises(ValueError):
+            call_with_retries(bad_request, (TransientError,), self.breaker)
+
+        self.assertIsNone(cache.get(self.breaker._trial_key))
+        self.assertEqual(call_with_retries(lambda timeout: 'ok', (TransientError,), self.breaker), 'ok')
+
+
+class MinHashBandShapeTest(SimpleTestCase):
+    """
+    LSH bands must only make pairs near the duplicate threshold candidates
+    """
+
+    threshold = 0.8
+
+    def test_band_shape_follows_threshold(self):
+        bands, rows = minhash.band_shape(self.threshold)
+        self.assertLessEqual(bands * rows, minhash.NUM_PERMUTATIONS)
+        self.assertTrue(0.7 <= (1 / bands) ** (1 / rows) < self.threshold)
+
+    def test_half_similar_pair_is_not_a_candidate(self):
+        text = 'Which keyword defines a function in Python? def'
+        other = 'Which keyword defines a generator function in modern Python? yield'
+        self.assertAlmostEqual(minhash.similarity(minhash.shingles(text), minhash.shingles(other)), 0.5, delta=0.05)
+
+        self.assertFalse(
+            set(minhash.text_buckets(text, self.threshold)) & set(minhash.text_buckets(other, self.threshold))
+        )
+
+    def test_near_duplicate_pair_is_a_candidate(self):
+        text = 'Which keyword defines a function in Python? def'
+        other = 'Which keyword defines a function in Python code? def'
+        self.assertGreaterEqual(minhash.similarity(minhash.shingles(text), minhash.shingles(other)), 0.75)
+
+        self.assertTrue(
+            set(minhash.text_buckets(text, self.threshold)) & set(minhash.text_buckets(other, self.threshold))
+        )
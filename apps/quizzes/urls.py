@@ -21,5 +21,8 @@ urlpatterns = [
     
     # AJAX endpoints
     path('save-answer/', views.save_answer_view, name='save_answer'),
+    path('take/<int:attempt_id>/questions/', views.quiz_questions_view, name='quiz_questions'),
+    path('quiz/<int:quiz_id>/payload/<int:version>/', views.quiz_payload_view, name='quiz_payload'),
     path('ai-explanation/<int:answer_id>/', views.ai_explanation_view, name='ai_explanation'),  # Task 3.3
+    path('ai-explanations/attempt/<int:attempt_id>/', views.attempt_ai_explanations_view, name='attempt_ai_explanations'),
 ]
@@ -6,12 +6,18 @@ import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django.utils import timezone
 from django.db import transaction
 from .models import Category, Subcategory, Quiz, Question, UserQuizAttempt, UserAnswer
 from .services.quiz_service import quiz_service
 from .services.scoring_service import scoring_service
+from .services.explanation_service import explanation_service
+from .services.snapshot_service import quiz_snapshot_service
 import json
 import logging
 
@@ -77,11 +83,11 @@ def subcategory_selection_view(request, category_slug):
                 num_questions=num_questions
             )
             
-            # Create attempt
+            # Create attempt (a streaming quiz is still receiving questions)
             attempt = UserQuizAttempt.objects.create(
                 user=request.user,
                 quiz=quiz,
-                total_questions=quiz.total_questions
+                total_questions=num_questions if quiz.is_generating else quiz.total_questions
             )
             
             messages.success(request, f'Quiz started! You have {quiz.time_limit // 60} minutes.')
@@ -126,8 +132,9 @@ def take_quiz_view(request, attempt_id):
         messages.warning(request, 'This quiz has already been completed')
         return redirect('quizzes:quiz_results', attempt_id=attempt.id)
     
-    # Get questions
-    questions = attempt.quiz.questions.all().order_by('order')
+    # Questions are fetched by the page from the cacheable quiz payload
+    quiz = attempt.quiz
+    payload_url = reverse('quizzes:quiz_payload', args=[quiz.id, quiz_snapshot_service.version(quiz)])
     
     # Get user's existing answers
     user_answers = {
@@ -144,9 +151,10 @@ def take_quiz_view(request, attempt_id):
     
     context = {
         'attempt': attempt,
-        'quiz': attempt.quiz,
-        'questions': questions,
-        'user_answers': user_answers,
+        'quiz': quiz,
+        'payload_url': payload_url,
+        'expected_questions': attempt.total_questions if quiz.is_generating else quiz.question_count,
+        'user_answers': json.dumps(user_answers),
         'answered_question_ids': json.dumps(answered_question_ids),
         'time_remaining': time_remaining,
         'time_limit': attempt.quiz.time_limit,
@@ -154,6 +162,66 @@ def take_quiz_view(request, attempt_id):
     return render(request, 'quizzes/take_quiz.html', context)
 
 
+@login_required
+def quiz_questions_view(request, attempt_id):
+    """
+    AJAX endpoint returning questions streamed in after the quiz page loaded
+    Polled by the take-quiz page while the quiz is still generating
+    """
+    attempt = get_object_or_404(
+        UserQuizAttempt.objects.select_related('quiz'),
+        id=attempt_id,
+        user=request.user
+    )
+    
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid position'}, status=400)
+    
+    questions = [
+        question for question in quiz_snapshot_service.get(attempt.quiz)['questions']
+        if question['order'] > after
+    ]
+    
+    return JsonResponse({
+        'status': 'success',
+        'generation_status': attempt.quiz.generation_status,
+        'questions': questions,
+    })
+
+
+@login_required
+def quiz_payload_view(request, quiz_id, version):
+    """
+    Read-only JSON question payload of a quiz, without answer keys
+    
+    The URL carries the snapshot version, so the payload of a ready quiz
+    never changes under it: it is served with a long-lived immutable
+    Cache-Control and a strong content-hash ETag, and repeat loads are
+    answered from the browser cache or with a 304.
+    """
+    quiz = get_object_or_404(Quiz.objects.filter(attempts__user=request.user).distinct(), id=quiz_id)
+    
+    current = quiz_snapshot_service.version(quiz)
+    if version != current:
+        return redirect('quizzes:quiz_payload', quiz_id=quiz.id, version=current)
+    
+    body, etag = quiz_snapshot_service.payload(quiz)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    
+    response['ETag'] = etag
+    if quiz.is_generating:
+        # Still receiving questions; revalidate every time
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, private=True, max_age=settings.QUIZ_PAYLOAD_MAX_AGE, immutable=True)
+    return response
+
+
 @login_required
 def save_answer_view(request):
     """
@@ -180,7 +248,7 @@ def save_answer_view(request):
         attempt = get_object_or_404(UserQuizAttempt, id=attempt_id, user=request.user, completed=False)
         
         # Get question
-        question = get_object_or_404(Question, id=question_id, quiz=attempt.quiz)
+        question = get_object_or_404(Question, id=question_id, quizzes=attempt.quiz)
         
         # Save answer
         scoring_service.save_answer(attempt, question, selected_answer)
@@ -267,48 +335,48 @@ def ai_explanation_view(request, answer_id):
     """
     Task 3.3: Generate AI explanation for incorrect answer
     AJAX endpoint that returns explanation for a user's answer
+    Serves the question's stored rationale instantly; ?more=1 asks the AI
+    for a fuller explanation
     """
     try:
         # Get the user answer
         answer = get_object_or_404(
-            UserAnswer.objects.select_related('question', 'attempt'),
+            UserAnswer.objects.select_related('question', 'attempt__quiz__category'),
             id=answer_id,
             attempt__user=request.user
         )
         
-        # Check if explanation already exists (cached)
-        if answer.ai_explanation:
+        # Check if explanation already exists (cached on the answer or shared)
+        explanation = explanation_service.get_cached_explanation(answer)
+        if explanation:
             return JsonResponse({
                 'success': True,
-                'explanation': answer.ai_explanation,
+                'explanation': explanation,
                 'cached': True
             })
         
+        # Rationale generated with the question, unless the user asked for more
+        rationale = explanation_service.get_rationale(answer)
+        if rationale and not request.GET.get('more'):
+            return JsonResponse({
+                'success': True,
+                'explanation': rationale,
+                'cached': True,
+                'can_explain_more': True
+            })
+        
         # Generate new explanation
-        from django.conf import settings as django_settings
+        from .services.ai_service import ai_generator
         
-        # Check if API key is configured
-        if not django_settings.OPENAI_API_KEY:
+        # Check if the AI backend (API key) is configured
+        if not ai_generator.is_configured():
             return JsonResponse({
                 'success': False,
                 'error': 'OpenAI API key not configured. Please add OPENAI_API_KEY to your .env file.'
             }, status=503)
         
-        from .services.ai_service import ai_generator
-        
-        question = answer.question
-        options = question.get_options()
-        
-        explanation = ai_generator.generate_answer_explanation(
-            question_text=question.question_text,
-            selected_answer=answer.selected_answer,
-            correct_answer=question.correct_answer,
-            options=options
-        )
-        
-        # Cache the explanation
-        answer.ai_explanation = explanation
-        answer.save()
+        # Stored in the shared explanation store for every student picking this option
+        explanation = explanation_service.generate_explanation(answer)
         
         return JsonResponse({
             'success': True,
@@ -329,3 +397,29 @@ def ai_explanation_view(request, answer_id):
             'success': False,
             'error': f'Failed to generate explanation: {str(e)}'
         }, status=500)
+
+
+@login_required
+def attempt_ai_explanations_view(request, attempt_id):
+    """
+    AJAX endpoint that explains every incorrect answer of an attempt at once
+    Store misses are generated in a single batched completion and saved to
+    the shared explanation store together
+    """
+    attempt = get_object_or_404(UserQuizAttempt.objects.select_related('quiz__category'), id=attempt_id, user=request.user, completed=True)
+    
+    try:
+        explanations, from_rationales = explanation_service.explain_attempt(attempt)
+        
+        return JsonResponse({
+            'success': True,
+            'explanations': explanations,
+            'expandable': sorted(from_rationales),
+        })
+        
+    except Exception as e:
+        logger.error(f"Error generating AI explanations for attempt: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': f'Failed to generate explanations: {str(e)}'
+        }, status=500)
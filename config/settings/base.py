@@ -4,7 +4,7 @@ Base settings for Intelligent Quiz project.
 
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -115,14 +115,115 @@ LOGOUT_REDIRECT_URL = 'home'
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap4"
 CRISPY_TEMPLATE_PACK = "bootstrap4"
 
+# AI Provider ('openai', or 'stub' for offline load tests and CI)
+AI_PROVIDER = config('AI_PROVIDER', default='openai')
+AI_STUB_LATENCY_MEDIAN = config('AI_STUB_LATENCY_MEDIAN', default=1.5, cast=float)  # seconds
+AI_STUB_LATENCY_SIGMA = config('AI_STUB_LATENCY_SIGMA', default=0.5, cast=float)  # log-normal shape
+AI_STUB_ERROR_RATE = config('AI_STUB_ERROR_RATE', default=0.0, cast=float)  # 0.0 - 1.0
+AI_STUB_SEED = config('AI_STUB_SEED', default=42, cast=int)
+# Seed with AI_STUB_SEED alone, so every process and run repeats the same output
+AI_STUB_DETERMINISTIC = config('AI_STUB_DETERMINISTIC', default=False, cast=bool)
+AI_STUB_TOKENS_PER_SECOND = config('AI_STUB_TOKENS_PER_SECOND', default=0, cast=float)  # 0 disables output-length latency
+
 # OpenAI Configuration
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
 OPENAI_MODEL = 'gpt-3.5-turbo'
 OPENAI_MAX_TOKENS = 2000
+OPENAI_MAX_COMPLETION_TOKENS = 4096  # the model's output limit, caps multi-level generations
 OPENAI_TEMPERATURE = 0.7
+OPENAI_CHUNK_SIZE = config('OPENAI_CHUNK_SIZE', default=5, cast=int)  # questions per parallel request
+OPENAI_MAX_CONCURRENCY = config('OPENAI_MAX_CONCURRENCY', default=4, cast=int)  # parallel requests per generation
+AI_RESPONSE_FORMAT = config('AI_RESPONSE_FORMAT', default='json')  # 'json', or 'compact' line-delimited arrays
+
+# AI Request Coalescing (one in-flight generation per key across workers)
+AI_SINGLE_FLIGHT_LOCK_TIMEOUT = 60  # seconds before a crashed leader's lock expires
+AI_SINGLE_FLIGHT_WAIT_TIMEOUT = 25  # seconds a follower waits, below gunicorn's 30s --timeout
+AI_SINGLE_FLIGHT_POLL_INTERVAL = 0.25
+AI_EXPLANATION_CACHE_TIMEOUT = 86400  # 1 day
+AI_EXPLANATION_BATCH_SIZE = 10  # incorrect answers explained per completion
+
+# AI Resilience (hard timeouts, bounded retries, circuit breaker)
+AI_CONNECT_TIMEOUT = config('AI_CONNECT_TIMEOUT', default=3.0, cast=float)  # seconds
+AI_READ_TIMEOUT = config('AI_READ_TIMEOUT', default=20.0, cast=float)  # seconds
+AI_REQUEST_DEADLINE = 25  # seconds all attempts of a call share, below gunicorn's 30s --timeout
+AI_MAX_RETRIES = 2
+AI_RETRY_BASE_DELAY = 0.5  # seconds, doubled per attempt with full jitter
+AI_RETRY_MAX_DELAY = 4.0
+AI_CIRCUIT_FAILURE_THRESHOLD = 5  # failures within the window that open the breaker
+AI_CIRCUIT_FAILURE_WINDOW = 60  # seconds
+AI_CIRCUIT_COOLDOWN = 30  # seconds the breaker stays open before a trial call
+
+# AI Rate Limiting (shared token buckets with priority classes, see services.rate_limiter)
+AI_RATE_LIMIT_RPM = config('AI_RATE_LIMIT_RPM', default=500, cast=int)  # requests per minute, all workers
+AI_RATE_LIMIT_TPM = config('AI_RATE_LIMIT_TPM', default=160000, cast=int)  # tokens per minute, all workers
+AI_RATE_LIMIT_RESERVE = {  # share of each bucket a priority class must leave for higher ones
+    'interactive': 0.0,
+    'generation': 0.2,
+    'background': 0.5,
+}
+AI_RATE_LIMIT_MAX_WAIT = {  # seconds a call may queue for a slot
+    'interactive': 5,
+    'generation': 10,
+    'background': 300,
+}
+AI_USER_DAILY_REQUESTS = config('AI_USER_DAILY_REQUESTS', default=200, cast=int)
+AI_USER_DAILY_TOKENS = config('AI_USER_DAILY_TOKENS', default=300000, cast=int)
+
+# AI Model Routing and Hedging (see services.model_router)
+AI_QUESTION_MODELS = config('AI_QUESTION_MODELS', default=OPENAI_MODEL, cast=Csv())  # preferred model first
+AI_EXPLANATION_MODELS = config('AI_EXPLANATION_MODELS', default=OPENAI_MODEL, cast=Csv())  # e.g. a smaller, faster model
+AI_HEDGE_ENABLED = config('AI_HEDGE_ENABLED', default=True, cast=bool)
+AI_HEDGE_PERCENTILE = 0.9  # a call still running at this latency percentile of its model is hedged
+AI_HEDGE_MIN_SAMPLES = 20  # samples a model needs before its histogram is used
+AI_HEDGE_DEFAULT_DELAY = 8.0  # seconds, hedge deadline while a model has too few samples
+AI_HEDGE_MIN_DELAY = 0.5  # seconds
+AI_HEDGE_MIN_BUDGET = 5.0  # seconds of the call's AI_REQUEST_DEADLINE a hedge needs left
+AI_HEDGE_MAX_WORKERS = 16  # threads per process running hedged calls; calls beyond them are not hedged
+AI_LATENCY_WINDOW = 3600  # seconds per latency histogram window; the last two are used
+
+# AI Call Ledger (buffered per-call usage rows, see services.ledger)
+AI_LEDGER_ENABLED = config('AI_LEDGER_ENABLED', default=True, cast=bool)
+AI_LEDGER_BATCH_SIZE = 100  # buffered rows that trigger an early write
+AI_LEDGER_FLUSH_INTERVAL = 5  # seconds between background writes
+AI_MODEL_PRICES = {  # USD per 1K (prompt, completion) tokens, matched by model name prefix
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.0025, 0.01),
+}
+AI_CACHED_PROMPT_DISCOUNT = 0.5  # share of the prompt price not billed for cached prompt tokens
+
+# Near-duplicate Detection (MinHash/LSH, see services.duplicate_service)
+QUESTION_DUPLICATE_THRESHOLD = 0.8  # Jaccard similarity of stem and answer shingles
 
 # Quiz Settings
-QUIZ_QUESTIONS_CACHE_TIMEOUT = 3600  # 1 hour
 QUIZ_DEFAULT_TIME_LIMIT = 600  # 10 minutes in seconds
 QUIZ_MIN_QUESTIONS = 5
 QUIZ_MAX_QUESTIONS = 20
+
+# Question Pool Settings (question bank per category/subcategory/difficulty, shared by quizzes)
+QUIZ_POOL_LOW_WATER = config('QUIZ_POOL_LOW_WATER', default=20, cast=int)
+QUIZ_POOL_TARGET = config('QUIZ_POOL_TARGET', default=60, cast=int)
+QUIZ_POOL_MAX_BATCHES_PER_REFILL = 5
+QUIZ_POOL_REFILL_LOCK_TIMEOUT = 300  # 5 minutes
+QUIZ_POOL_HEALTHY_TIMEOUT = 600  # seconds a cell found at the low-water mark is not checked again
+QUIZ_POOL_FILL_WAIT_TIMEOUT = 20  # seconds a quiz waits for another request filling its cell, below gunicorn's 30s --timeout
+QUIZ_POOL_FILL_POLL_INTERVAL = 0.25  # seconds
+# Refill from a request-spawned thread; disable when running refill_question_pool --loop
+QUIZ_POOL_BACKGROUND_REFILL = config('QUIZ_POOL_BACKGROUND_REFILL', default=True, cast=bool)
+QUIZ_SAMPLE_PROBES = 4  # random_key range scans per sampled quiz
+
+# Quiz Snapshot Settings (serialized questions of a quiz for the take-quiz page)
+QUIZ_SNAPSHOT_CACHE_TIMEOUT = 86400  # 1 day; keys are versioned, so this only bounds memory
+QUIZ_SNAPSHOT_LOCAL_ENTRIES = 500  # per-process LRU
+QUIZ_PAYLOAD_MAX_AGE = 31536000  # 1 year; payload URLs carry the snapshot version
+
+# Seen Question Filter Settings (per-user Bloom filter, prefers unseen bank questions)
+QUIZ_SEEN_FILTER_BITS = 32768  # 4 KB per user
+QUIZ_SEEN_FILTER_HASHES = 5
+QUIZ_SEEN_FILTER_CAPACITY = 4000  # ~3% false positives; the filter starts over beyond this
+QUIZ_SEEN_OVERSAMPLE = 3  # candidates read per wanted question when a filter is used
+
+# Streaming Generation Settings (used when the bank cannot fill a quiz)
+QUIZ_STREAMING_GENERATION = True
+QUIZ_STREAM_READY_QUESTIONS = 3  # open the quiz once this many questions exist
+QUIZ_STREAM_READY_TIMEOUT = 25  # seconds, below gunicorn's 30s --timeout
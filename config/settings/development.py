@@ -17,7 +17,12 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
         'OPTIONS': {
             'timeout': 20,  # Increase timeout to reduce "database is locked" errors
-        }
+        },
+        'TEST': {
+            # A file rather than shared-cache memory, so tests running
+            # requests in threads wait on locks with the timeout above
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -20,6 +20,25 @@ DATABASES = {
     }
 }
 
+# Cache - must be shared by all gunicorn workers for AI request coalescing
+# Uses Redis when REDIS_URL is set (pip install redis), otherwise the database
+# (run: python manage.py createcachetable)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
 # Security settings
 SECURE_SSL_REDIRECT = True
 SESSION_COOKIE_SECURE = True
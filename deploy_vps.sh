@@ -138,7 +138,7 @@ chown -R $APP_USER:$APP_USER $APP_DIR
 print_status "Directories and permissions set"
 
 echo "Step 10: Running Django migrations..."
-su - $APP_USER -c "cd $APP_DIR && source venv/bin/activate && python manage.py migrate"
+su - $APP_USER -c "cd $APP_DIR && source venv/bin/activate && python manage.py migrate && python manage.py createcachetable"
 print_status "Database migrated"
 
 echo "Step 11: Collecting static files..."